@@ -1,21 +1,20 @@
 import os
-import json
 from flask import Blueprint, request, jsonify, current_app
-from flask_socketio import emit
 
-api_bp = Blueprint('api', __name__)
+from config_store import ButtonConfigStore
+from scene_state import SceneState
 
-BUTTON_CONFIG_FILE = os.path.join(os.path.dirname(__file__), 'button_config.json')
+api_bp = Blueprint('api', __name__)
 
-def load_button_config():
-    if not os.path.exists(BUTTON_CONFIG_FILE):
-        return {}
-    with open(BUTTON_CONFIG_FILE, 'r') as f:
-        return json.load(f)
+# The change log is kept next to it, with a .log extension
+BUTTON_CONFIG_FILE = os.environ.get(
+    'BUTTON_CONFIG_FILE', os.path.join(os.path.dirname(__file__), 'button_config.json'))
 
-def save_button_config(config):
-    with open(BUTTON_CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=2)
+button_store = ButtonConfigStore(
+    BUTTON_CONFIG_FILE,
+    flush_interval=float(os.environ.get('BUTTON_CONFIG_FLUSH_INTERVAL', 0.5))
+)
+scene_state = SceneState(button_store, history=int(os.environ.get('SCENE_HISTORY', 1024)))
 
 @api_bp.route('/button/config', methods=['POST'])
 def update_button_config():
@@ -26,15 +25,18 @@ def update_button_config():
         if not data or 'id' not in data:
             return jsonify({'status': 'error', 'message': 'Invalid button config data'}), 400
 
-        config = load_button_config()
-        config[data['id']] = data
-
-        save_button_config(config)
+        required_fields = ['position', 'rotation', 'scale']
+        for field in required_fields:
+            if field not in data:
+                data[field] = {'x': 0, 'y': 0, 'z': 0} if field != 'scale' else 1
+                current_app.logger.warning(f"Missing {field} in button config, using default")
 
-        # Emit update to all clients
-        emit('button_config_updated', data, broadcast=True, namespace='/')
+        # Applied by every worker in backend order, which broadcasts only the
+        # changed fields to its clients. The version is the backend's sequence
+        # number for this change, not whatever this worker has applied so far.
+        version = current_app.extensions['cluster'].submit_config(data['id'], data)
 
-        return jsonify({'status': 'success', 'data': data})
+        return jsonify({'status': 'success', 'data': data, 'version': version})
     except Exception as e:
         current_app.logger.error(f"Error updating button configuration: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -43,8 +45,13 @@ def update_button_config():
 def get_button_config():
     """Retrieve all saved button configurations."""
     try:
-        config = load_button_config()
-        return jsonify({'status': 'success', 'data': config})
+        snapshot = scene_state.snapshot()
+        return jsonify({
+            'status': 'success',
+            'data': snapshot['buttons'],
+            'epoch': snapshot['epoch'],
+            'version': snapshot['version']
+        })
     except Exception as e:
         current_app.logger.error(f"Error retrieving button configuration: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
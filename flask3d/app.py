@@ -1,22 +1,46 @@
 import eventlet
 eventlet.monkey_patch()
 
-from flask import Flask, render_template, jsonify, request, send_from_directory
+from flask import Flask, render_template, jsonify, request, send_from_directory, Response
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 import logging
 import os
+import shutil
+import tempfile
+
+from api_routes import api_bp, button_store, scene_state
+from assets import AssetPipeline
+from module_index import ModuleIndex
+from broadcast import LEGACY, BroadcastScheduler
+from cluster import ClusterBridge, run_workers, start_broker
+from headless_browser import CaptureUnavailable, create_capture_service
+from metrics import instrument_app, instrument_event, metrics_response, registry
+from pubsub import BackendManager, create_backend
+from scene_state import DELTA_EVENT, merge_deltas
+from wire_codec import ButtonIndex, FORMAT_BINARY, FORMAT_JSON, FORMAT_VERSION, make_binary_encoder
 
 # Configure logging
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+# Worker processes sharing one listener; state and broadcasts go through PUBSUB_URL
+WORKERS = int(os.environ.get('WORKERS', 1))
+PORT = int(os.environ.get('PORT', 5000))
+PUBSUB_URL = os.environ.get('PUBSUB_URL') or (
+    f"unix://{os.path.join(tempfile.gettempdir(), f'flask3d-broker-{PORT}.sock')}"
+    if WORKERS > 1 else 'local://'
+)
+pubsub_backend = create_backend(PUBSUB_URL)
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.urandom(24)
-app.config['DEBUG'] = True
+# Debug (and the verbose logging and full-rate metrics that follow it) unless
+# FLASK_DEBUG=0, which gives the production defaults
+app.config['DEBUG'] = os.environ.get('FLASK_DEBUG', '1').lower() not in ('0', 'false', 'no')
 
 # Enable CORS for all routes
 CORS(app, resources={
@@ -28,21 +52,58 @@ CORS(app, resources={
     }
 })
 
+# Per-message Socket.IO/engine.io logs and WSGI access logs; with many clients
+# these cost more than the handlers themselves, so turn them off in production
+VERBOSE_LOGGING = os.environ.get('VERBOSE_LOGGING', '1' if app.debug else '0') != '0'
+
+# Count every request and event; time a sample of them for the latency histograms
+registry.sample_rate = float(os.environ.get('METRICS_SAMPLE_RATE', 1.0 if app.debug else 0.1))
+instrument_app(app)
+
+# Button configuration REST API
+app.register_blueprint(api_bp, url_prefix='/api')
+
 # Configure static files with proper MIME types
 @app.after_request
 def add_header(response):
     if response.mimetype == 'application/javascript':
         response.headers['Content-Type'] = 'application/javascript; charset=utf-8'
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
+    # Responses that set their own caching policy keep it
+    if 'Cache-Control' not in response.headers:
+        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+        response.headers['Pragma'] = 'no-cache'
+        response.headers['Expires'] = '0'
     return response
 
+# Module graph of the static folder, refreshed incrementally from file mtimes
+ASSET_ENTRYPOINT = os.environ.get('ASSET_ENTRYPOINT', 'js/main.js')
+module_index = ModuleIndex(app.static_folder, url_prefix=app.static_url_path,
+                           entrypoints=[ASSET_ENTRYPOINT])
+
+# Fingerprinted, precompressed JS/CSS, rebuilt whenever the index changes
+assets = AssetPipeline(module_index, url_prefix=app.static_url_path)
+module_index.add_listener(lambda index: assets.build())
+module_index.refresh()
+
+@app.context_processor
+def asset_helpers():
+    """Expose asset_url() and modulepreload() to templates."""
+    return {'asset_url': assets.url_for, 'modulepreload': assets.modulepreload_tags}
+
+def serve_static(filename):
+    """Serve built assets from memory and anything else from the static folder."""
+    asset = assets.lookup(filename)
+    if asset is None:
+        return send_from_directory(app.static_folder, filename)
+    return assets.respond(asset, filename)
+
+app.view_functions['static'] = serve_static
+
 # Serve JavaScript modules with proper MIME type
 @app.route('/static/js/<path:filename>')
 def serve_js(filename):
-    logger.info(f"Serving JavaScript file: {filename}")
-    response = send_from_directory('static/js', filename)
+    logger.debug("Serving JavaScript file: %s", filename)
+    response = serve_static(f"js/{filename}")
     if filename.endswith('.js'):
         response.headers['Content-Type'] = 'application/javascript; charset=utf-8'
     return response
@@ -50,32 +111,94 @@ def serve_js(filename):
 # Debug route to check module loading
 @app.route('/debug/modules')
 def debug_modules():
-    """List all available JavaScript modules."""
-    js_dir = os.path.join(app.static_folder, 'js')
-    files = []
-    for file in os.listdir(js_dir):
-        if file.endswith('.js'):
-            with open(os.path.join(js_dir, file), 'r') as f:
-                content = f.read()
-                files.append({
-                    'name': file,
-                    'size': len(content),
-                    'imports': [line for line in content.split('\n') if line.startswith('import')]
-                })
-    return jsonify(files)
+    """Report the JavaScript module graph from the in-memory index."""
+    return Response(module_index.report_json, mimetype='application/json')
+
+@app.route('/metrics')
+def metrics():
+    """Expose counters, gauges and latency histograms in the Prometheus text format."""
+    return metrics_response()
 
 # Initialize SocketIO with eventlet and CORS
+socketio_options = {}
+if not PUBSUB_URL.startswith('local:'):
+    # Share emits to rooms and other workers' clients over the pub/sub backend
+    socketio_options['client_manager'] = BackendManager(pubsub_backend)
+if WORKERS > 1:
+    # Workers share the listening socket, so there are no sticky sessions for
+    # long-polling; clients must connect with the websocket transport
+    socketio_options['transports'] = ['websocket']
+
 socketio = SocketIO(
     app,
     cors_allowed_origins="*",
     async_mode='eventlet',
-    logger=True,
-    engineio_logger=True,
+    logger=VERBOSE_LOGGING,
+    engineio_logger=VERBOSE_LOGGING,
     ping_timeout=60,
     ping_interval=25,
     max_http_buffer_size=1e8,
-    async_handlers=True
+    async_handlers=True,
+    **socketio_options
+)
+
+# Coalesce broadcasts per button and fan them out once per tick
+broadcaster = BroadcastScheduler(
+    socketio,
+    tick_hz=float(os.environ.get('BROADCAST_HZ', 30)),
+    max_queued=int(os.environ.get('BROADCAST_MAX_QUEUED', 8)),
+    enabled=os.environ.get('BROADCAST_COALESCE', '1') != '0'
 )
+broadcaster.set_merge(DELTA_EVENT, merge_deltas)
+
+# Opt-in packed float32 transforms for clients that negotiate the binary format
+button_index = ButtonIndex()
+broadcaster.set_encoder(FORMAT_BINARY, make_binary_encoder(button_index))
+
+# Clients that don't negotiate a format keep getting the original events:
+# button_state_changed as is and button_config_updated with the full config
+broadcaster.set_legacy(DELTA_EVENT, lambda delta: ('button_config_updated', button_store.get(delta['id'])))
+app.extensions['broadcast'] = broadcaster
+
+# Route config changes and interactions through the pub/sub backend so every
+# worker applies them in the same order
+cluster = ClusterBridge(pubsub_backend, scene_state, broadcaster)
+app.extensions['cluster'] = cluster
+if WORKERS == 1:
+    cluster.start()
+
+# Pick up static file changes without a restart (polling; 0 disables)
+ASSET_WATCH_INTERVAL = float(os.environ.get('ASSET_WATCH_INTERVAL', 1.0 if app.debug else 0))
+if ASSET_WATCH_INTERVAL > 0:
+    module_index.watch(socketio.start_background_task, socketio.sleep, ASSET_WATCH_INTERVAL)
+
+# Render workers are started on first use, i.e. after forking in multi-worker mode.
+# Workers share rendered images through a directory, since the follow-up image
+# request usually reaches a different worker than the capture did.
+capture_service = create_capture_service(
+    socketio,
+    blob_dir=os.path.join(tempfile.gettempdir(), f'flask3d-captures-{PORT}') if WORKERS > 1 else None
+)
+
+# Queue depths and client counts are read when /metrics is scraped
+registry.gauge('flask3d_connected_clients', 'Connected Socket.IO clients by wire format',
+               lambda: {(wire_format,): count
+                        for wire_format, count in broadcaster.client_counts()[0].items()},
+               ['format'])
+registry.gauge('flask3d_broadcast_pending_updates', 'Updates waiting for the next broadcast tick',
+               broadcaster.pending_count)
+registry.gauge('flask3d_broadcast_backlog_updates', 'Updates held back for slow clients',
+               lambda: broadcaster.client_counts()[1])
+registry.gauge('flask3d_scene_version', 'Current scene version', lambda: scene_state.version)
+registry.gauge('flask3d_capture_pool_waiting', 'Capture jobs waiting for a render worker',
+               lambda: capture_service.pool.waiting)
+registry.gauge('flask3d_capture_cache_bytes', 'Bytes of cached capture images',
+               lambda: capture_service.cache.size_bytes)
+
+# Event loop lag shows handlers or logging blocking the eventlet hub (0 disables)
+HUB_LAG_INTERVAL = float(os.environ.get('METRICS_HUB_LAG_INTERVAL', 0.5))
+if HUB_LAG_INTERVAL > 0:
+    registry.watch_hub_lag(socketio.start_background_task, socketio.sleep, HUB_LAG_INTERVAL)
 
 @socketio.on_error()
 def error_handler(e):
@@ -86,57 +209,142 @@ def error_handler(e):
 @app.route('/')
 def index():
     """Serve the main 3D environment page."""
-    return render_template('index.html')
-
-@app.route('/api/button/config', methods=['POST'])
-def update_button_config():
-    """Update button configuration."""
-    try:
-        data = request.get_json()
-        if not data or 'id' not in data:
-            raise ValueError('Invalid button configuration: missing id')
-        
-        required_fields = ['position', 'rotation', 'scale']
-        for field in required_fields:
-            if field not in data:
-                data[field] = {'x': 0, 'y': 0, 'z': 0} if field != 'scale' else 1
-                logger.warning(f"Missing {field} in button config, using default")
-        
-        logger.info(f"Received button config update: {data}")
-        socketio.emit('button_config_updated', data)
-        return jsonify({'status': 'success', 'data': data})
-    except ValueError as e:
-        logger.error(f"Validation error: {str(e)}")
-        return jsonify({'status': 'error', 'message': str(e)}), 400
-    except Exception as e:
-        logger.error(f"Error updating button configuration: {str(e)}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    response = app.make_response(render_template('index.html'))
+    preload = assets.preload_header(ASSET_ENTRYPOINT)
+    if preload:
+        response.headers['Link'] = preload
+    return response
 
 @app.route('/api/browser/capture', methods=['POST'])
 def capture_browser():
-    """Capture headless browser content."""
+    """Capture headless browser content (Roadmap 1.2).
+
+    Returns the digest and URL of the rendered PNG; repeated captures of the
+    same URL and viewport are served from the cache until they expire.
+    """
     try:
         data = request.get_json()
+        if not data or not data.get('url'):
+            raise ValueError('Invalid capture request: missing url')
         url = data.get('url')
-        # TODO: Implement headless browser capture
-        logger.info(f"Capturing content from URL: {url}")
-        return jsonify({'status': 'success', 'url': url})
+        logger.debug("Capturing content from URL: %s", url)
+        digest, cached = capture_service.capture(
+            url,
+            width=int(data.get('width', 1280)),
+            height=int(data.get('height', 720)),
+            full_page=bool(data.get('full_page', False))
+        )
+        return jsonify({
+            'status': 'success',
+            'url': url,
+            'digest': digest,
+            'cached': cached,
+            'image_url': f"/api/browser/capture/{digest}.png"
+        })
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except CaptureUnavailable as e:
+        logger.error(f"Browser capture unavailable: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 503
     except Exception as e:
         logger.error(f"Error capturing browser content: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/api/browser/capture/<digest>.png')
+def capture_image(digest):
+    """Serve a cached capture by its content digest."""
+    image = capture_service.cache.image(digest)
+    if image is None:
+        return not_found_error(None)
+    response = Response(image, mimetype='image/png')
+    # Content-addressed, so the body for a digest never changes
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.set_etag(digest)
+    return response.make_conditional(request)
+
 @socketio.on('connect')
-def handle_connect():
-    """Handle client connection."""
-    logger.info('Client connected')
-    emit('connection_response', {'status': 'connected'})
+@instrument_event('connect')
+def handle_connect(auth=None):
+    """Handle client connection.
+
+    Clients opt into batched ``broadcast_batch`` frames and scene deltas by
+    passing ``{'format': 'json'}`` or ``{'format': 'binary'}`` (transforms as
+    packed binary) as auth data, optionally with ``{'epoch': ..., 'version': ...}``
+    to receive only the scene deltas they missed instead of a full snapshot.
+    Other clients get the legacy per-event ``button_state_changed`` and
+    ``button_config_updated`` broadcasts.
+    """
+    logger.debug('Client connected')
+    auth = auth if isinstance(auth, dict) else {}
+    wire_format = auth.get('format')
+    # Replies below go to this client only (ignore_queue); the pub/sub backend
+    # would just relay them to every other worker to be dropped
+    if wire_format not in (FORMAT_JSON, FORMAT_BINARY):
+        broadcaster.add_client(request.sid, LEGACY)
+        emit('connection_response', {'status': 'connected'}, ignore_queue=True)
+        return
+    broadcaster.add_client(request.sid, wire_format)
+    emit('connection_response', {'status': 'connected'}, ignore_queue=True)
+    if wire_format == FORMAT_BINARY:
+        emit('wire_format', {
+            'format': FORMAT_BINARY,
+            'version': FORMAT_VERSION,
+            'index': button_index.table()
+        }, ignore_queue=True)
+    send_scene_sync(auth)
+
+@socketio.on('scene_sync')
+@instrument_event('scene_sync')
+def handle_scene_sync(data=None):
+    """Send the scene deltas or snapshot a client needs to catch up."""
+    send_scene_sync(data)
+
+def send_scene_sync(data):
+    # Shared with connect, outside the instrumented handler so connects are not
+    # also counted as scene_sync events
+    data = data if isinstance(data, dict) else {}
+    event, payload = scene_state.sync_payload(data.get('epoch'), data.get('version'))
+    emit(event, payload, ignore_queue=True)
 
 @socketio.on('disconnect')
-def handle_disconnect():
+@instrument_event('disconnect')
+def handle_disconnect(reason=None):
     """Handle client disconnection."""
-    logger.info('Client disconnected')
+    logger.debug('Client disconnected')
+    broadcaster.remove_client(request.sid)
+    capture_service.stop_all(request.sid)
+
+@socketio.on('capture_stream_start')
+@instrument_event('capture_stream_start')
+def handle_capture_stream_start(data):
+    """Start streaming frames of a page to this client (Roadmap 2.3)."""
+    try:
+        if not data or 'url' not in data or 'stream_id' not in data:
+            raise ValueError('Invalid capture stream request')
+        capture_service.start_stream(
+            request.sid,
+            data['stream_id'],
+            data['url'],
+            width=int(data.get('width', 1280)),
+            height=int(data.get('height', 720)),
+            interval=float(data.get('interval', 1.0))
+        )
+        return {'status': 'success', 'stream_id': data['stream_id']}
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        return {'status': 'error', 'message': str(e)}
+
+@socketio.on('capture_stream_stop')
+@instrument_event('capture_stream_stop')
+def handle_capture_stream_stop(data):
+    """Stop one of this client's capture streams."""
+    if data and 'stream_id' in data:
+        capture_service.stop_stream(request.sid, data['stream_id'])
+    return {'status': 'success'}
 
 @socketio.on('button_interaction')
+@instrument_event('button_interaction')
 def handle_button_interaction(data):
     """Handle button interactions (hover, click, etc.)."""
     try:
@@ -145,26 +353,27 @@ def handle_button_interaction(data):
             
         interaction_type = data.get('type')
         button_id = data.get('button_id')
-        logger.info(f"Button interaction: {interaction_type} on button {button_id}")
+        # Lazy arguments: formatting every interaction costs even when debug is off
+        logger.debug("Button interaction: %s on button %s", interaction_type, button_id)
         
         # Broadcast the interaction to all clients with correct data structure
-        emit('button_state_changed', {
+        cluster.publish('button_state_changed', button_id, {
             'id': button_id,  # Changed from button_id to id
             'state': interaction_type,  # Changed from type to state
             'status': 'success'
-        }, broadcast=True)
+        })
     except ValueError as e:
         logger.error(f"Validation error: {str(e)}")
         emit('button_state_changed', {
             'status': 'error',
             'message': str(e)
-        })
+        }, ignore_queue=True)
     except Exception as e:
         logger.error(f"Error handling button interaction: {str(e)}")
         emit('button_state_changed', {
             'status': 'error',
             'message': str(e)
-        })
+        }, ignore_queue=True)
 
 @app.errorhandler(404)
 def not_found_error(error):
@@ -176,10 +385,32 @@ def internal_error(error):
     """Handle 500 errors."""
     return jsonify({'error': 'Internal server error', 'message': 'An unexpected error occurred'}), 500
 
+def serve_worker(sock, index=0):
+    """Run the WSGI server on an already bound socket."""
+    if WORKERS > 1:
+        # Only one worker persists button config; all of them apply every change
+        button_store.persist = index == 0
+        registry.const_labels['worker'] = str(index)
+        if isinstance(socketio.server.manager, BackendManager):
+            socketio.server.manager.reset_host_id()
+        cluster.start()
+    eventlet.wsgi.server(
+        sock,
+        app,
+        log_output=VERBOSE_LOGGING,
+        debug=app.debug,
+        log=logger
+    )
+
+def shutdown_worker(index):
+    """Persist pending button config and stop render workers before a worker exits."""
+    button_store.close()
+    capture_service.pool.close()
+
 if __name__ == '__main__':
     try:
         # Get port from environment or use default
-        port = int(os.environ.get('PORT', 5000))
+        port = PORT
         
         # Log startup information
         logger.info(f"Starting server on port {port}")
@@ -187,13 +418,23 @@ if __name__ == '__main__':
         logger.info(f"Debug mode: {app.debug}")
         
         # Create eventlet WSGI server
-        eventlet.wsgi.server(
-            eventlet.listen(('0.0.0.0', port)),
-            app,
-            log_output=True,
-            debug=app.debug,
-            log=logger
-        )
+        sock = eventlet.listen(('0.0.0.0', port))
+        if WORKERS > 1:
+            logger.info(f"Starting {WORKERS} workers with pub/sub backend {PUBSUB_URL}")
+            broker = None
+            if 'PUBSUB_URL' not in os.environ:
+                broker = start_broker(PUBSUB_URL[len('unix://'):])
+            # The parent only supervises; worker 0 owns persistence
+            button_store.persist = False
+            try:
+                run_workers(WORKERS, lambda index: serve_worker(sock, index), shutdown_worker)
+            finally:
+                if broker is not None:
+                    broker.terminate()
+                if capture_service.cache.blob_dir is not None:
+                    shutil.rmtree(capture_service.cache.blob_dir, ignore_errors=True)
+        else:
+            serve_worker(sock)
     except Exception as e:
         logger.error(f"Failed to start server: {str(e)}")
         raise
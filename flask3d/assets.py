@@ -0,0 +1,185 @@
+"""Build-at-startup pipeline for JS/CSS static assets.
+
+Every JS and CSS file in the module index is content-hashed and made
+available under a fingerprinted name (``js/scene.3f2a1b9c.js``) that is served
+with immutable, year-long caching. Relative import specifiers in JS modules are
+rewritten to the fingerprinted names of their targets, so a module's
+fingerprint covers its whole import graph. Modules that import each other in a
+cycle share one hash over the cycle.
+
+Entrypoints are the exception: pages load them by their plain URL, so they
+keep it in rewritten imports, ``asset_url`` and preloads. Otherwise a module
+importing an entrypoint (a back-edge of a cycle) would load it a second time
+under its fingerprinted name.
+
+Bodies are held in memory together with precompressed gzip and (if the
+``brotli`` package is installed) brotli variants. Unversioned URLs keep working
+and are revalidated with ETags. Rebuilding after the index changes only
+recompresses assets whose fingerprint changed.
+"""
+import re
+import gzip
+import hashlib
+import logging
+import posixpath
+
+from flask import Response, request
+from markupsafe import Markup, escape
+
+from module_index import strongly_connected
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    '.js': 'application/javascript; charset=utf-8',
+    '.mjs': 'application/javascript; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Relative specifiers in static imports, re-exports and dynamic import()
+IMPORT_PATTERN = re.compile(
+    r"""(?P<prefix>\bimport\s*\(\s*|\bfrom\s*|\bimport\s*)(?P<quote>['"])(?P<spec>\.{1,2}/[^'"]+)(?P=quote)"""
+)
+
+
+class Asset:
+    """One built asset and its precompressed variants."""
+
+    def __init__(self, path, fingerprinted, body, content_type):
+        self.path = path
+        self.fingerprinted = fingerprinted
+        self.content_type = content_type
+        self.etag = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {'identity': body}
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(compressed) < len(body):
+            self.variants['gzip'] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(body)
+            if len(compressed) < len(body):
+                self.variants['br'] = compressed
+
+
+def resolve_specifier(path, spec):
+    """Resolve a relative import specifier against the importing asset's path."""
+    return posixpath.normpath(posixpath.join(posixpath.dirname(path), spec))
+
+
+class AssetPipeline:
+    """Fingerprinted, precompressed JS/CSS assets served from memory."""
+
+    def __init__(self, index, url_prefix='/static', hash_length=8):
+        self.index = index
+        self.url_prefix = url_prefix
+        self.hash_length = hash_length
+        self._assets = {}
+        self._by_path = {}
+
+    def build(self):
+        """Fingerprint and compress every JS/CSS file in the module index."""
+        graph = self.index.graph()
+        fingerprints = {}
+        for component in strongly_connected(graph):
+            digest = hashlib.sha256()
+            for path in component:
+                digest.update(path.encode() + b'\0' + self.index.source(path))
+                for dep in sorted(graph[path]):
+                    if dep not in component:
+                        digest.update(fingerprints[dep].encode())
+            for path in component:
+                base, ext = posixpath.splitext(path)
+                fingerprints[path] = f"{base}.{digest.hexdigest()[:self.hash_length]}{ext}"
+
+        # Imports of entrypoints resolve to the URL the page loads them by
+        urls = dict(fingerprints)
+        urls.update((entry, entry) for entry in self.index.entrypoints if entry in urls)
+
+        assets = {}
+        by_path = {}
+        rebuilt = 0
+        for path, fingerprinted in fingerprints.items():
+            # Same fingerprint means same rewritten body; skip recompressing it
+            asset = self._assets.get(fingerprinted)
+            if asset is None:
+                body = self._rewrite(path, self.index.source(path), urls)
+                asset = Asset(path, fingerprinted, body,
+                              CONTENT_TYPES[posixpath.splitext(path)[1]])
+                rebuilt += 1
+            assets[fingerprinted] = asset
+            assets[path] = asset
+            by_path[path] = asset
+        self._assets = assets
+        self._by_path = by_path
+        logger.info(f"Built {rebuilt} of {len(by_path)} static assets")
+        dead = self.index.dead_modules()
+        if dead:
+            logger.warning(f"Modules not reachable from {', '.join(self.index.entrypoints)}: {', '.join(dead)}")
+
+    def _rewrite(self, path, source, urls):
+        if not path.endswith(('.js', '.mjs')):
+            return source
+        directory = posixpath.dirname(path)
+
+        def replace(match):
+            target = resolve_specifier(path, match.group('spec'))
+            if target not in urls:
+                return match.group(0)
+            relative = posixpath.relpath(urls[target], directory or '.')
+            if not relative.startswith('.'):
+                relative = './' + relative
+            return f"{match.group('prefix')}{match.group('quote')}{relative}{match.group('quote')}"
+
+        return IMPORT_PATTERN.sub(replace, source.decode('utf-8')).encode('utf-8')
+
+    def lookup(self, path):
+        """Return the asset for a logical or fingerprinted path, or None."""
+        return self._assets.get(path)
+
+    def url_for(self, path):
+        """Return the fingerprinted URL of an asset, or its plain static URL.
+
+        Entrypoints always get their plain URL, the one their imports use.
+        """
+        asset = self._by_path.get(path)
+        if asset is None or path in self.index.entrypoints:
+            return f"{self.url_prefix}/{path}"
+        return f"{self.url_prefix}/{asset.fingerprinted}"
+
+    def preload_order(self, entry):
+        """Return the static import graph of ``entry``, dependencies first."""
+        return [path for path in self.index.preload_order(entry) if path in self._by_path]
+
+    def modulepreload_tags(self, entry):
+        """Return ``<link rel="modulepreload">`` tags for ``entry``'s import graph."""
+        return Markup('\n'.join(
+            f'<link rel="modulepreload" href="{escape(self.url_for(path))}">'
+            for path in self.preload_order(entry)
+        ))
+
+    def preload_header(self, entry):
+        """Return a ``Link`` header value preloading ``entry``'s import graph."""
+        return ', '.join(f'<{self.url_for(path)}>; rel=modulepreload'
+                         for path in self.preload_order(entry))
+
+    def respond(self, asset, requested_path):
+        """Build the response for ``asset`` honouring Accept-Encoding and If-None-Match."""
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in asset.variants and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+
+        response = Response(asset.variants[encoding], content_type=asset.content_type)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = IMMUTABLE if requested_path == asset.fingerprinted else REVALIDATE
+        response.set_etag(asset.etag if encoding == 'identity' else f"{asset.etag}-{encoding}")
+        return response.make_conditional(request)
@@ -0,0 +1,108 @@
+"""Microbenchmark: JSON versus binary broadcast frames for transform updates.
+
+Builds one broadcast_batch frame holding a full transform delta for each of
+``--buttons`` buttons, then times encoding and decoding it as a Socket.IO
+packet in both wire formats and reports the bytes per update.
+
+    python benchmarks/bench_wire_codec.py --buttons 1 10 100 1000 --json
+"""
+import os
+import sys
+import json
+import random
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from socketio import packet
+
+from scene_state import DELTA_EVENT
+from broadcast import BATCH_EVENT, BroadcastScheduler
+from wire_codec import ButtonIndex, decode_transforms, make_binary_encoder
+
+
+def make_updates(count):
+    """Build a batch of scene deltas that move, rotate and scale ``count`` buttons."""
+    updates = {}
+    for i in range(count):
+        changes = {f'{field}.{axis}': random.uniform(-10, 10)
+                   for field in ('position', 'rotation') for axis in 'xyz'}
+        changes['scale'] = random.uniform(0.5, 2)
+        updates[(DELTA_EVENT, f'button-{i}')] = {
+            'version': i + 1, 'id': f'button-{i}', 'set': changes
+        }
+    return updates
+
+
+def encode_packet(frame):
+    """Encode a frame the way the server puts it on the wire."""
+    encoded = packet.Packet(packet.EVENT, data=[BATCH_EVENT, frame]).encode()
+    return encoded if isinstance(encoded, list) else [encoded]
+
+
+def decode_packet(parts):
+    """Decode wire parts back into a frame, unpacking binary transforms."""
+    pkt = packet.Packet(encoded_packet=parts[0])
+    for attachment in parts[1:]:
+        pkt.add_attachment(attachment)
+    frame = pkt.data[1]
+    if 'transforms' in frame:
+        frame['transforms'] = decode_transforms(frame['transforms'])
+    return frame
+
+
+def wire_size(parts):
+    return sum(len(part.encode('utf-8') if isinstance(part, str) else part)
+               for part in parts)
+
+
+def bench(buttons, number):
+    updates = make_updates(buttons)
+    binary_encode = make_binary_encoder(ButtonIndex())
+    binary_encode(0, updates)  # intern ids up front, as on a warm server
+
+    codecs = {
+        'json': lambda: BroadcastScheduler._build_frame(1, updates),
+        'binary': lambda: binary_encode(1, updates),
+    }
+    results = []
+    for name, build in codecs.items():
+        parts = encode_packet(build())
+        encode_time = timeit.timeit(lambda: encode_packet(build()), number=number) / number
+        decode_time = timeit.timeit(lambda: decode_packet(parts), number=number) / number
+        size = wire_size(parts)
+        results.append({
+            'format': name,
+            'buttons': buttons,
+            'encode_us': encode_time * 1e6,
+            'decode_us': decode_time * 1e6,
+            'bytes': size,
+            'bytes_per_update': size / buttons,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--buttons', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--number', type=int, default=200,
+                        help='iterations per measurement')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = []
+    for buttons in args.buttons:
+        results.extend(bench(buttons, args.number))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'format':<8}{'buttons':>8}{'encode us':>12}{'decode us':>12}{'bytes':>10}{'B/update':>10}")
+    for r in results:
+        print(f"{r['format']:<8}{r['buttons']:>8}{r['encode_us']:>12.1f}{r['decode_us']:>12.1f}"
+              f"{r['bytes']:>10}{r['bytes_per_update']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
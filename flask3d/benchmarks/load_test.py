@@ -0,0 +1,616 @@
+"""Load test: many Socket.IO clients plus REST traffic against a running server.
+
+Connects ``--clients`` Socket.IO clients (spread over ``--processes`` client
+processes), has ``--senders`` of them emit ``button_interaction`` at a total
+of ``--rate`` per second, and records the end-to-end latency of every
+``button_state_changed`` broadcast each client receives, whether it arrives
+directly or inside a ``broadcast_batch`` frame. At the same time
+``/api/button/config`` is driven with POST/GET requests at ``--rest-rate``
+per second; every POST moves a button, so the resulting ``scene_delta``
+broadcasts carry transforms, and their latency is recorded separately.
+
+``--formats`` selects the protocol the clients negotiate: ``legacy`` (no
+``auth``; per-event ``button_state_changed``/``button_config_updated``),
+``json`` or ``binary`` (batched frames, with transforms packed into a binary
+attachment for ``binary``). Binary clients decode the packed transforms, and
+every client counts the bytes it reads off its websocket, so the formats can
+be compared on bytes per client as well as on latency and client CPU.
+
+By default a server is started for every combination of ``--formats`` and
+``--coalesce`` (``python app.py`` with ``PORT``, ``WORKERS``,
+``BROADCAST_COALESCE`` and any ``--server-env``), so the server's memory per
+connection can be measured from /proc. Each started server keeps its button
+config in a fresh temporary directory (``BUTTON_CONFIG_FILE``), so runs start
+from the same empty scene and never touch the app's own
+``button_config.json``. Pass ``--url`` to target a server that is already
+running instead.
+
+    python benchmarks/load_test.py --clients 1000 --rate 200 --rest-rate 200 \\
+        --formats legacy json binary \\
+        --coalesce on off --json --output results.json
+
+Latencies are measured against the sender's wall clock, so run the load
+generator on the same machine as the server. The generator itself is Python;
+check that its processes are not saturated (``client_cpu_seconds``) before
+reading much into high percentiles.
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import shutil
+import resource
+import tempfile
+import itertools
+import subprocess
+
+from eventlet.hubs import trampoline
+
+import requests
+import socketio
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from wire_codec import decode_transforms
+
+INTERACTION_EVENT = 'button_interaction'
+STATE_EVENT = 'button_state_changed'
+BATCH_EVENT = 'broadcast_batch'
+DELTA_EVENT = 'scene_delta'
+LEGACY_CONFIG_EVENT = 'button_config_updated'
+FORMATS = ('legacy', 'json', 'binary')
+TOKEN_PREFIX = 'load:'
+
+
+class LatencyHistogram:
+    """Log-bucketed histogram (about 2.5% resolution) that merges across processes."""
+
+    MIN = 1e-5
+    RATIO = 1.05
+
+    def __init__(self, counts=None):
+        self.counts = {int(k): v for k, v in (counts or {}).items()}
+        self.total = sum(self.counts.values())
+
+    def add(self, seconds):
+        index = 0
+        if seconds > self.MIN:
+            index = int(math.log(seconds / self.MIN) / math.log(self.RATIO))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+
+    def percentile(self, q):
+        """Return the upper bound of the bucket holding quantile ``q``, in seconds."""
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return self.MIN * self.RATIO ** (index + 1)
+        return None
+
+    def summary_ms(self):
+        return {f'p{round(q * 100, 1):g}': (round(value * 1000, 3) if value is not None else None)
+                for q in (0.5, 0.9, 0.99, 0.999, 1.0)
+                for value in [self.percentile(q)]}
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def process_tree_rss(pid):
+    """Return the resident memory of ``pid`` and all its descendants, in bytes."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total
+
+
+# -- client process -----------------------------------------------------------
+
+class ClientProcess:
+    """A share of the simulated clients, driven from one eventlet process."""
+
+    def __init__(self, url, first_id, count, wire_format):
+        self.url = url
+        self.first_id = first_id
+        self.count = count
+        self.wire_format = wire_format
+        self.clients = []
+        self.recording = False
+        self.received = 0
+        self.sent = 0
+        self.send_errors = 0
+        self.latency = LatencyHistogram()
+        self.deltas_received = 0
+        self.delta_latency = LatencyHistogram()
+        self.transforms_decoded = 0
+        self.bytes_received = 0
+        self.connect_latency = LatencyHistogram()
+        self.connect_errors = 0
+
+    def _on_state(self, payload):
+        if not self.recording or not isinstance(payload, dict):
+            return
+        state = payload.get('state')
+        if isinstance(state, str) and state.startswith(TOKEN_PREFIX):
+            self.received += 1
+            self.latency.add(max(time.time() - float(state[len(TOKEN_PREFIX):]), 0.0))
+
+    def _on_config(self, values):
+        # ``values`` is a delta's ``set`` or, for legacy clients, the whole config
+        if not self.recording or not isinstance(values, dict):
+            return
+        sent_at = values.get('sent_at')
+        if isinstance(sent_at, (int, float)):
+            self.deltas_received += 1
+            self.delta_latency.add(max(time.time() - sent_at, 0.0))
+
+    def _on_delta(self, delta):
+        if isinstance(delta, dict):
+            self._on_config(delta.get('set'))
+
+    def _on_batch(self, frame):
+        events = frame.get('events', {})
+        for payload in events.get(STATE_EVENT, ()):
+            self._on_state(payload)
+        if self.recording and frame.get('transforms'):
+            # Decode like a real client would, so client CPU reflects the format
+            self.transforms_decoded += len(decode_transforms(frame['transforms'])[1])
+        for delta in events.get(DELTA_EVENT, ()):
+            self._on_delta(delta)
+
+    def _count_bytes(self, sio):
+        """Count what the client reads off its websocket while recording."""
+        ws = sio.eio.ws
+        recv = ws.recv
+
+        def counting_recv():
+            data = recv()
+            if self.recording and data:
+                self.bytes_received += len(data.encode() if isinstance(data, str) else data)
+            return data
+        ws.recv = counting_recv
+
+    def _connect_one(self, client_id):
+        sio = socketio.Client(reconnection=False)
+        sio.on(STATE_EVENT, self._on_state)
+        if self.wire_format == 'legacy':
+            sio.on(LEGACY_CONFIG_EVENT, self._on_config)
+            auth = None
+        else:
+            sio.on(BATCH_EVENT, self._on_batch)
+            auth = {'format': self.wire_format}
+        started = time.perf_counter()
+        try:
+            sio.connect(self.url, transports=['websocket'], auth=auth, wait_timeout=30)
+        except Exception:
+            self.connect_errors += 1
+            return
+        self.connect_latency.add(time.perf_counter() - started)
+        self._count_bytes(sio)
+        self.clients.append((sio, f'load-{client_id}'))
+
+    def connect(self, concurrency):
+        pool = eventlet.GreenPool(concurrency)
+        for client_id in range(self.first_id, self.first_id + self.count):
+            pool.spawn_n(self._connect_one, client_id)
+        pool.waitall()
+
+    def send(self, senders, rate, duration):
+        """Emit interactions from the first ``senders`` clients at ``rate`` per second."""
+        senders = self.clients[:senders]
+        end = time.monotonic() + duration
+        if rate <= 0 or not senders:
+            eventlet.sleep(duration)
+            return
+        interval = 1.0 / rate
+        next_at = time.monotonic()
+        for sio, button_id in itertools.cycle(senders):
+            now = time.monotonic()
+            if now >= end:
+                break
+            if next_at > now:
+                eventlet.sleep(next_at - now)
+            elif now - next_at > 1.0:
+                # Too far behind to catch up; the achieved rate shows it
+                next_at = now
+            next_at += interval
+            try:
+                sio.emit(INTERACTION_EVENT, {'type': f'{TOKEN_PREFIX}{time.time():.6f}',
+                                             'button_id': button_id})
+                self.sent += 1
+            except Exception:
+                self.send_errors += 1
+
+    def disconnect(self):
+        pool = eventlet.GreenPool(100)
+        for sio, _ in self.clients:
+            pool.spawn_n(sio.disconnect)
+        pool.waitall()
+
+
+def run_client_process(args):
+    raise_fd_limit()
+    process = ClientProcess(args.url, args.first_id, args.clients, args.format)
+    process.connect(args.connect_concurrency)
+    emit_line({'connected': len(process.clients), 'connect_errors': process.connect_errors})
+
+    # Wait for the go signal without blocking the clients' heartbeats
+    trampoline(sys.stdin.fileno(), read=True)
+    sys.stdin.readline()
+
+    cpu_started = time.process_time()
+    process.recording = True
+    process.send(args.senders, args.rate, args.duration)
+    eventlet.sleep(args.drain)
+    process.recording = False
+    cpu = time.process_time() - cpu_started
+    emit_line({
+        'sent': process.sent,
+        'send_errors': process.send_errors,
+        'received': process.received,
+        'latency': process.latency.counts,
+        'deltas_received': process.deltas_received,
+        'delta_latency': process.delta_latency.counts,
+        'transforms_decoded': process.transforms_decoded,
+        'bytes_received': process.bytes_received,
+        'connect_latency': process.connect_latency.counts,
+        'cpu_seconds': cpu,
+    })
+    process.disconnect()
+
+
+def emit_line(data):
+    sys.stdout.write(json.dumps(data) + '\n')
+    sys.stdout.flush()
+
+
+# -- REST load ------------------------------------------------------------------
+
+def rest_worker(url, rate, duration, stats):
+    session = requests.Session()
+    interval = 1.0 / rate
+    end = time.monotonic() + duration
+    next_at = time.monotonic()
+    n = 0
+    while time.monotonic() < end:
+        eventlet.sleep(max(next_at - time.monotonic(), 0))
+        next_at += interval
+        n += 1
+        method = 'POST' if n % 2 else 'GET'
+        started = time.perf_counter()
+        try:
+            if method == 'POST':
+                response = session.post(f'{url}/api/button/config', json={
+                    'id': f'rest-{random.randrange(20)}',
+                    'position': {axis: random.uniform(-5, 5) for axis in 'xyz'},
+                    'rotation': {axis: random.uniform(-3, 3) for axis in 'xyz'},
+                    'scale': random.uniform(0.5, 2),
+                    'sent_at': time.time(),
+                }, timeout=30)
+            else:
+                response = session.get(f'{url}/api/button/config', timeout=30)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        stats[method]['latency'].add(time.perf_counter() - started)
+        stats[method]['requests'] += 1
+        if not ok:
+            stats[method]['errors'] += 1
+
+
+def run_rest_load(url, rate, concurrency, duration):
+    stats = {method: {'requests': 0, 'errors': 0, 'latency': LatencyHistogram()}
+             for method in ('POST', 'GET')}
+    if rate > 0:
+        pool = eventlet.GreenPool(concurrency)
+        for _ in range(concurrency):
+            pool.spawn_n(rest_worker, url, rate / concurrency, duration, stats)
+        pool.waitall()
+    return {method: {'requests': s['requests'], 'errors': s['errors'],
+                     'throughput': s['requests'] / duration,
+                     'latency_ms': s['latency'].summary_ms()}
+            for method, s in stats.items()}
+
+
+# -- orchestration --------------------------------------------------------------
+
+def scrape_metrics(url):
+    """Return the unbucketed samples of the server's /metrics endpoint, if it has one."""
+    try:
+        response = requests.get(f'{url}/metrics', timeout=10)
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    samples = {}
+    for line in response.text.splitlines():
+        if line.startswith('#') or '_bucket' in line or not line.strip():
+            continue
+        name, _, value = line.rpartition(' ')
+        samples[name] = float(value)
+    return samples
+
+
+def start_server(args, coalesce):
+    """Start ``app.py`` with its button config in a new temporary directory.
+
+    Returns ``(server, url, data_dir)``; pass both to :func:`stop_server`.
+    """
+    data_dir = tempfile.mkdtemp(prefix='flask3d-load-')
+    env = dict(os.environ, PORT=str(args.port), WORKERS=str(args.workers),
+               BROADCAST_COALESCE='1' if coalesce == 'on' else '0',
+               BUTTON_CONFIG_FILE=os.path.join(data_dir, 'button_config.json'),
+               VERBOSE_LOGGING='0', LOG_LEVEL='WARNING', ASSET_WATCH_INTERVAL='0')
+    for item in args.server_env:
+        key, _, value = item.partition('=')
+        env[key] = value
+    server = subprocess.Popen([sys.executable, 'app.py'], cwd=APP_DIR, env=env)
+    url = f'http://127.0.0.1:{args.port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        try:
+            if requests.get(f'{url}/api/button/config', timeout=1).status_code == 200:
+                return server, url, data_dir
+        except requests.RequestException:
+            pass
+        eventlet.sleep(0.2)
+    stop_server(server, data_dir)
+    raise RuntimeError('Server did not become ready within 30s')
+
+
+def stop_server(server, data_dir):
+    server.terminate()
+    try:
+        server.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def split(total, parts):
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def run_config(args, wire_format, coalesce):
+    server = None
+    url = args.url
+    server_pid = args.server_pid
+    if url is None:
+        server, url, data_dir = start_server(args, coalesce)
+        server_pid = server.pid
+    try:
+        eventlet.sleep(args.settle)
+        rss_before = process_tree_rss(server_pid) if server_pid else None
+
+        processes = min(args.processes, args.clients)
+        client_counts = split(args.clients, processes)
+        total_senders = min(args.senders, args.clients)
+        sender_counts = split(total_senders, processes)
+        children = []
+        first_id = 0
+        for count, senders in zip(client_counts, sender_counts):
+            children.append(subprocess.Popen([
+                sys.executable, os.path.abspath(__file__), '--role', 'client',
+                '--url', url, '--format', wire_format,
+                '--clients', str(count), '--first-id', str(first_id),
+                '--senders', str(senders), '--rate', str(args.rate * senders / max(total_senders, 1)),
+                '--duration', str(args.duration), '--drain', str(args.drain),
+                '--connect-concurrency', str(args.connect_concurrency),
+            ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True))
+            first_id += count
+
+        connect_started = time.perf_counter()
+        ready = [json.loads(child.stdout.readline() or '{}') for child in children]
+        connect_seconds = time.perf_counter() - connect_started
+        connected = sum(r.get('connected', 0) for r in ready)
+
+        eventlet.sleep(args.settle)
+        rss_connected = process_tree_rss(server_pid) if server_pid else None
+
+        for child in children:
+            child.stdin.write('go\n')
+            child.stdin.flush()
+        rest = run_rest_load(url, args.rest_rate, args.rest_concurrency, args.duration)
+        results = [json.loads(child.stdout.readline() or '{}') for child in children]
+        for child in children:
+            child.stdin.close()
+            child.wait()
+        metrics = scrape_metrics(url)
+    finally:
+        if server is not None:
+            stop_server(server, data_dir)
+
+    latency = LatencyHistogram()
+    delta_latency = LatencyHistogram()
+    connect_latency = LatencyHistogram()
+    for r in results:
+        latency.merge(LatencyHistogram(r.get('latency')))
+        delta_latency.merge(LatencyHistogram(r.get('delta_latency')))
+        connect_latency.merge(LatencyHistogram(r.get('connect_latency')))
+    sent = sum(r.get('sent', 0) for r in results)
+    received = sum(r.get('received', 0) for r in results)
+    expected = sent * connected
+    deltas_received = sum(r.get('deltas_received', 0) for r in results)
+    deltas_expected = rest['POST']['requests'] * connected
+    bytes_received = sum(r.get('bytes_received', 0) for r in results)
+
+    memory = None
+    if rss_before is not None:
+        memory = {
+            'server_rss_before_bytes': rss_before,
+            'server_rss_connected_bytes': rss_connected,
+            'bytes_per_connection': (rss_connected - rss_before) / connected if connected else None,
+        }
+    return {
+        'config': {
+            'format': wire_format,
+            'coalesce': coalesce,
+            'workers': args.workers if args.url is None else None,
+            'clients': args.clients,
+            'senders': min(args.senders, args.clients),
+            'rate': args.rate,
+            'rest_rate': args.rest_rate,
+            'duration': args.duration,
+            'server_env': args.server_env,
+        },
+        'connections': {
+            'connected': connected,
+            'errors': sum(r.get('connect_errors', 0) for r in ready),
+            'seconds': connect_seconds,
+            'latency_ms': connect_latency.summary_ms(),
+        },
+        'interactions': {
+            'sent': sent,
+            'send_errors': sum(r.get('send_errors', 0) for r in results),
+            'throughput': sent / args.duration,
+        },
+        'broadcasts': {
+            'received': received,
+            'throughput': received / args.duration,
+            # Below 1 when coalescing drops superseded states (or messages are lost)
+            'delivery_ratio': received / expected if expected else None,
+            'latency_ms': latency.summary_ms(),
+        },
+        'scene_deltas': {
+            'received': deltas_received,
+            'throughput': deltas_received / args.duration,
+            # Below 1 when coalescing merges deltas to the same button
+            'delivery_ratio': deltas_received / deltas_expected if deltas_expected else None,
+            'latency_ms': delta_latency.summary_ms(),
+            'transforms_decoded': sum(r.get('transforms_decoded', 0) for r in results),
+        },
+        'traffic': {
+            'bytes_received': bytes_received,
+            'bytes_per_client_per_second': (bytes_received / connected / args.duration
+                                            if connected else None),
+        },
+        'rest': rest,
+        'memory': memory,
+        'client_cpu_seconds': [r.get('cpu_seconds') for r in results],
+        'server_metrics': metrics,
+    }
+
+
+def print_table(runs):
+    nan = float('nan')
+    print(f"{'format':<8}{'coalesce':<10}{'clients':>8}{'sent/s':>9}{'recv/s':>10}{'ratio':>7}"
+          f"{'p50 ms':>9}{'p99 ms':>9}{'Δ p50':>9}{'Δ p99':>9}{'KiB/s/cl':>10}"
+          f"{'POST p99':>10}{'KiB/conn':>10}")
+    for run in runs:
+        config = run['config']
+        latency = run['broadcasts']['latency_ms']
+        delta_latency = run['scene_deltas']['latency_ms']
+        ratio = run['broadcasts']['delivery_ratio']
+        traffic = run['traffic']['bytes_per_client_per_second']
+        memory = run['memory'] and run['memory']['bytes_per_connection']
+        post_p99 = run['rest']['POST']['latency_ms']['p99']
+        print(f"{config['format']:<8}{config['coalesce']:<10}{run['connections']['connected']:>8}"
+              f"{run['interactions']['throughput']:>9.1f}{run['broadcasts']['throughput']:>10.1f}"
+              f"{ratio if ratio is not None else nan:>7.2f}"
+              f"{latency['p50'] or nan:>9.2f}{latency['p99'] or nan:>9.2f}"
+              f"{delta_latency['p50'] or nan:>9.2f}{delta_latency['p99'] or nan:>9.2f}"
+              f"{traffic / 1024 if traffic is not None else nan:>10.1f}"
+              f"{post_p99 or nan:>10.2f}"
+              f"{memory / 1024 if memory is not None else nan:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='target a running server instead of starting one')
+    parser.add_argument('--server-pid', type=int,
+                        help='pid of the --url server, to measure its memory')
+    parser.add_argument('--port', type=int, default=5055, help='port for started servers')
+    parser.add_argument('--workers', type=int, default=1, help='WORKERS for started servers')
+    parser.add_argument('--server-env', nargs='*', default=[], metavar='KEY=VALUE',
+                        help='extra environment for started servers')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=['json'],
+                        help='client protocols to compare; binary only differs on transforms')
+    parser.add_argument('--coalesce', nargs='+', choices=['on', 'off'], default=['on'])
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--processes', type=int, default=min(os.cpu_count() or 1, 4),
+                        help='client processes to spread the connections over')
+    parser.add_argument('--senders', type=int, default=50,
+                        help='clients that emit interactions')
+    parser.add_argument('--rate', type=float, default=100,
+                        help='interactions per second, across all senders')
+    parser.add_argument('--rest-rate', type=float, default=20,
+                        help='REST requests per second, half POST and half GET; '
+                             'each POST broadcasts a transform-bearing scene_delta')
+    parser.add_argument('--rest-concurrency', type=int, default=4)
+    parser.add_argument('--connect-concurrency', type=int, default=50,
+                        help='simultaneous connection attempts per client process')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load')
+    parser.add_argument('--drain', type=float, default=1.0,
+                        help='seconds to keep receiving after the load stops')
+    parser.add_argument('--settle', type=float, default=1.0,
+                        help='seconds to wait before each memory reading')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    # Internal: a client process started by the orchestrator
+    parser.add_argument('--role', default='orchestrator', help=argparse.SUPPRESS)
+    parser.add_argument('--format', default='json', help=argparse.SUPPRESS)
+    parser.add_argument('--first-id', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == 'client':
+        run_client_process(args)
+        return
+    if args.url is not None and len(args.coalesce) > 1:
+        parser.error('--coalesce is a server setting; it cannot be varied with --url')
+    if args.url is not None:
+        args.url = args.url.rstrip('/')
+        args.coalesce = ['n/a']
+
+    raise_fd_limit()
+    runs = []
+    for wire_format, coalesce in itertools.product(args.formats, args.coalesce):
+        print(f"Running format={wire_format} coalesce={coalesce} clients={args.clients}",
+              file=sys.stderr)
+        runs.append(run_config(args, wire_format, coalesce))
+
+    document = {'benchmark': 'load_test', 'timestamp': time.time(), 'runs': runs}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+    if args.json:
+        print(json.dumps(document, indent=2))
+    else:
+        print_table(runs)
+
+
+if __name__ == '__main__':
+    main()
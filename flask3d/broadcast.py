@@ -0,0 +1,260 @@
+import time
+import logging
+import threading
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+BATCH_EVENT = 'broadcast_batch'
+# Clients that did not negotiate batching get each tick's updates as separate
+# events, as before
+LEGACY = 'legacy'
+
+PUBLISHED = registry.counter(
+    'flask3d_broadcast_published_total', 'Updates published for broadcast', ['event'])
+BATCHES = registry.counter('flask3d_broadcast_batches_total', 'Broadcast ticks that sent a batch')
+BATCH_UPDATES = registry.counter(
+    'flask3d_broadcast_batch_updates_total', 'Updates left in broadcast batches after coalescing')
+FRAMES_SENT = registry.counter(
+    'flask3d_broadcast_frames_sent_total', 'Batch frames sent to clients', ['format', 'kind'])
+CLIENTS_DEFERRED = registry.counter(
+    'flask3d_broadcast_clients_deferred_total', 'Clients skipped for a tick because their queue was full')
+FLUSH_SECONDS = registry.histogram(
+    'flask3d_broadcast_flush_duration_seconds', 'Time to encode and fan out one batch (sampled)')
+
+
+class BroadcastScheduler:
+    """Coalesce broadcast events and fan them out once per tick.
+
+    Events published within one tick are keyed by ``(event, key)`` and only the
+    latest payload per key is kept, unless a merge function is registered for
+    the event (e.g. field-level deltas), in which case pending payloads for the
+    same key are combined. Every tick each connected client receives a
+    single ``broadcast_batch`` frame. Clients whose outgoing engine.io queue is
+    backed up are skipped; their updates are merged into a per-client backlog
+    (again latest-wins or merged), so a slow socket only ever owes one state
+    per key.
+
+    Clients join one room per wire format, so each tick's frame is encoded and
+    serialized once per format and emitted to the room, skipping clients that
+    are deferred or owed a catch-up frame. Formats other than the default JSON
+    frame are added with :meth:`set_encoder`.
+
+    Clients added as :data:`LEGACY` go through the same ticks, coalescing and
+    backlogs, but receive each update of the tick as its own event instead of
+    a frame, translated by :meth:`set_legacy` where the legacy protocol used a
+    different event.
+
+    With ``enabled=False`` nothing is coalesced or deferred: every published
+    update is sent straight away as a one-update frame, still encoded per
+    wire format (or as a single legacy event).
+    """
+
+    def __init__(self, socketio, tick_hz=30, max_queued=8, enabled=True, namespace='/'):
+        self.socketio = socketio
+        self.tick = 1.0 / tick_hz
+        self.max_queued = max_queued
+        self.enabled = enabled
+        self.namespace = namespace
+
+        self._pending = {}
+        self._clients = {}
+        self._mergers = {}
+        self._encoders = {'json': self._build_frame}
+        self._legacy = {}
+        self._format_counts = {}
+        self._lock = threading.Lock()
+        self._task = None
+        self._seq = 0
+
+    def set_merge(self, event, merge):
+        """Combine pending payloads of ``event`` with ``merge(older, newer)`` instead of replacing them."""
+        self._mergers[event] = merge
+
+    def set_encoder(self, wire_format, encode):
+        """Encode frames for clients of ``wire_format`` with ``encode(seq, updates, catch_up)``."""
+        self._encoders[wire_format] = encode
+
+    def set_legacy(self, event, translate):
+        """Send legacy clients ``translate(payload)`` as ``(event, payload)`` instead of ``event``."""
+        self._legacy[event] = translate
+
+    def add_client(self, sid, wire_format='json'):
+        """Start delivering batches (or legacy events) to a newly connected client."""
+        if wire_format != LEGACY and wire_format not in self._encoders:
+            raise ValueError(f"Unsupported wire format: {wire_format}")
+        with self._lock:
+            self._clients[sid] = (wire_format, {})
+            self._format_counts[wire_format] = self._format_counts.get(wire_format, 0) + 1
+        self.socketio.server.enter_room(sid, self._room(wire_format), namespace=self.namespace)
+        self._ensure_started()
+
+    def remove_client(self, sid):
+        """Forget a disconnected client and its backlog."""
+        with self._lock:
+            client = self._clients.pop(sid, None)
+            if client is not None:
+                self._format_counts[client[0]] -= 1
+        if client is not None:
+            self.socketio.server.leave_room(sid, self._room(client[0]), namespace=self.namespace)
+
+    def publish(self, event, key, payload):
+        """Queue ``payload`` for broadcast, replacing or merging any pending one for the same key."""
+        PUBLISHED.inc(event)
+        # Emits here and below only reach local clients; other workers
+        # broadcast their own copy
+        if not self.enabled:
+            self._send_now({(event, key): payload})
+            return
+        with self._lock:
+            self._merge_into(self._pending, {(event, key): payload})
+        self._ensure_started()
+
+    def _send_now(self, updates):
+        """Send one update straight away, as its own frame in every client's format."""
+        with self._lock:
+            self._seq += 1
+            formats = [(wire_format, count) for wire_format, count in self._format_counts.items() if count]
+        for wire_format, count in formats:
+            try:
+                self._send(wire_format, updates, self._room(wire_format))
+            except Exception as e:
+                logger.error(f"Error sending {wire_format} update: {str(e)}")
+                continue
+            FRAMES_SENT.inc(wire_format, 'single', amount=count)
+
+    def _emit_legacy(self, updates, to, skip_sid=None):
+        """Emit each update as its own (translated) event."""
+        for (event, _), payload in updates.items():
+            translate = self._legacy.get(event)
+            if translate is not None:
+                translated = translate(payload)
+                if translated is None:
+                    continue
+                event, payload = translated
+            self.socketio.emit(event, payload, to=to, skip_sid=skip_sid,
+                               namespace=self.namespace, ignore_queue=True)
+
+    def _send(self, wire_format, updates, to, skip_sid=None, catch_up=False):
+        if wire_format == LEGACY:
+            self._emit_legacy(updates, to, skip_sid)
+            return
+        frame = self._encoders[wire_format](self._seq, updates, catch_up=catch_up)
+        self.socketio.emit(BATCH_EVENT, frame, to=to, skip_sid=skip_sid,
+                           namespace=self.namespace, ignore_queue=True)
+
+    def pending_count(self):
+        """Return the number of updates waiting for the next tick."""
+        return len(self._pending)
+
+    def client_counts(self):
+        """Return ``(clients per wire format, total backlogged updates)``."""
+        with self._lock:
+            clients = list(self._clients.values())
+        counts = {}
+        backlog = 0
+        for wire_format, client_backlog in clients:
+            counts[wire_format] = counts.get(wire_format, 0) + 1
+            backlog += len(client_backlog)
+        return counts, backlog
+
+    def _merge_into(self, target, updates):
+        for update_key, payload in updates.items():
+            # Re-insert so the batch keeps the order of the latest updates
+            previous = target.pop(update_key, None)
+            merge = self._mergers.get(update_key[0])
+            if previous is not None and merge is not None:
+                payload = merge(previous, payload)
+            target[update_key] = payload
+
+    def _ensure_started(self):
+        if self.enabled and self._task is None:
+            self._task = self.socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.tick)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error broadcasting batch: {str(e)}")
+
+    def flush(self):
+        """Send the pending batch to every client that can take it."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            clients = list(self._clients.items())
+        if not batch and not any(backlog for _, (_, backlog) in clients):
+            return
+
+        started = time.perf_counter() if registry.sampled() else None
+        self._seq += 1
+        if batch:
+            BATCHES.inc()
+            BATCH_UPDATES.inc(amount=len(batch))
+
+        # Per wire format: [clients taking the shared frame, sids to skip]
+        rooms = {}
+        catch_up = []
+        deferred = 0
+        for sid, (wire_format, backlog) in clients:
+            room = rooms.setdefault(wire_format, [0, []])
+            if self._queue_depth(sid) >= self.max_queued:
+                # Slow socket: keep only the newest state per key until it drains
+                self._merge_into(backlog, batch)
+                room[1].append(sid)
+                deferred += 1
+            elif backlog:
+                self._merge_into(backlog, batch)
+                room[1].append(sid)
+                catch_up.append((sid, wire_format, backlog))
+            else:
+                room[0] += 1
+
+        # One emit per format (per update for legacy clients): the packet is
+        # encoded once and sent to the room. A format that fails to encode
+        # only costs its own clients the tick.
+        if batch:
+            for wire_format, (receivers, skip) in rooms.items():
+                if not receivers:
+                    continue
+                try:
+                    self._send(wire_format, batch, self._room(wire_format), skip_sid=skip)
+                except Exception as e:
+                    logger.error(f"Error sending {wire_format} batch: {str(e)}")
+                    continue
+                FRAMES_SENT.inc(wire_format, 'batch', amount=receivers)
+        for sid, wire_format, backlog in catch_up:
+            try:
+                self._send(wire_format, backlog, sid, catch_up=True)
+            except Exception as e:
+                logger.error(f"Error sending {wire_format} catch-up frame: {str(e)}")
+                continue
+            finally:
+                backlog.clear()
+            FRAMES_SENT.inc(wire_format, 'catch_up')
+
+        if deferred:
+            CLIENTS_DEFERRED.inc(amount=deferred)
+        if started is not None:
+            FLUSH_SECONDS.observe(time.perf_counter() - started)
+
+    def _room(self, wire_format):
+        return f'{BATCH_EVENT}:{wire_format}'
+
+    @staticmethod
+    def _build_frame(seq, updates, catch_up=False):
+        events = {}
+        for (event, _), payload in updates.items():
+            events.setdefault(event, []).append(payload)
+        return {'seq': seq, 'events': events}
+
+    def _queue_depth(self, sid):
+        """Return the number of packets waiting in a client's engine.io queue."""
+        server = self.socketio.server
+        try:
+            eio_sid = server.manager.eio_sid_from_sid(sid, self.namespace)
+            return server.eio.sockets[eio_sid].queue.qsize()
+        except (KeyError, AttributeError):
+            return 0
@@ -0,0 +1,149 @@
+"""Multi-worker support: state replication and the pre-fork process launcher.
+
+All button config changes and button interactions go through the pub/sub
+backend, even in single-worker mode, so every worker applies the same changes
+in the same order and broadcasts them to its own clients. The backend's
+sequence numbers are used as scene versions.
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import subprocess
+
+import eventlet
+
+from metrics import registry
+from scene_state import DELTA_EVENT
+
+logger = logging.getLogger(__name__)
+
+SCENE_CHANNEL = 'scene'
+INTERACTION_CHANNEL = 'interactions'
+
+MESSAGES_RECEIVED = registry.counter(
+    'flask3d_pubsub_messages_received_total', 'Messages received from the pub/sub backend', ['channel'])
+
+
+class ClusterBridge:
+    """Replicate scene changes and broadcasts between workers through a backend."""
+
+    def __init__(self, backend, scene_state, broadcaster):
+        self.backend = backend
+        self.scene_state = scene_state
+        self.broadcaster = broadcaster
+        self._started = False
+
+    def start(self):
+        """Subscribe to the backend; call once per worker process, after forking."""
+        if self._started:
+            return
+        self._started = True
+        self.scene_state.epoch = self.backend.epoch
+        self.backend.subscribe(SCENE_CHANNEL, self._on_scene)
+        self.backend.subscribe(INTERACTION_CHANNEL, self._on_interaction)
+
+    def submit_config(self, button_id, config):
+        """Publish a button config change to every worker, including this one.
+
+        Returns the sequence number the backend assigned to the change, i.e.
+        its scene version, or None if the backend did not report it in time.
+        """
+        return self.backend.publish(SCENE_CHANNEL, {'id': button_id, 'config': config}, wait=True)
+
+    def publish(self, event, key, payload):
+        """Broadcast an event to the clients of every worker."""
+        self.backend.publish(INTERACTION_CHANNEL, (event, key, payload))
+
+    def _on_scene(self, seq, message):
+        MESSAGES_RECEIVED.inc(SCENE_CHANNEL)
+        delta = self.scene_state.apply(message['id'], message['config'], version=seq)
+        if delta is not None:
+            self.broadcaster.publish(DELTA_EVENT, message['id'], delta)
+
+    def _on_interaction(self, seq, message):
+        MESSAGES_RECEIVED.inc(INTERACTION_CHANNEL)
+        self.broadcaster.publish(*message)
+
+
+def start_broker(path, timeout=5.0):
+    """Start the stand-in Unix socket broker in a subprocess and wait for it."""
+    # A socket file left by a killed broker would look ready before this one is
+    if os.path.exists(path):
+        os.remove(path)
+    broker = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(__file__), 'pubsub.py'), path])
+    deadline = time.monotonic() + timeout
+    while True:
+        if broker.poll() is not None or time.monotonic() > deadline:
+            broker.kill()
+            raise RuntimeError(f"Pub/sub broker failed to start on {path}")
+        # The file appears at bind(); only a successful connect means it is listening
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            return broker
+        except OSError:
+            time.sleep(0.05)
+        finally:
+            probe.close()
+
+
+def run_workers(count, serve, shutdown):
+    """Fork ``count`` workers running ``serve(index)`` and wait for them to exit.
+
+    ``shutdown(index)`` runs in a worker before it exits, whether it stops on
+    its own or is terminated by the parent. SIGTERM/SIGINT to the parent are
+    forwarded to all workers.
+    """
+    children = {}
+    for index in range(count):
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(index, serve, shutdown)
+        children[pid] = index
+        logger.info(f"Started worker {index} (pid {pid})")
+
+    def terminate(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+
+    while children:
+        try:
+            pid, status = os.waitpid(-1, 0)
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is not None:
+            logger.info(f"Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}")
+
+
+def _run_worker(index, serve, shutdown):
+    def stop():
+        try:
+            shutdown(index)
+        finally:
+            os._exit(0)
+
+    # Leave the signal handler straight away; the shutdown runs on the hub
+    signal.signal(signal.SIGTERM, lambda signum, frame: eventlet.spawn_n(stop))
+    # Ctrl-C reaches the whole process group; let the parent forward SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    code = 0
+    try:
+        serve(index)
+    except Exception as e:
+        logger.error(f"Worker {index} failed: {str(e)}")
+        code = 1
+    finally:
+        try:
+            shutdown(index)
+        finally:
+            os._exit(code)
@@ -0,0 +1,166 @@
+import os
+import json
+import atexit
+import logging
+import threading
+
+try:
+    from eventlet import patcher, tpool
+except ImportError:
+    tpool = None
+
+logger = logging.getLogger(__name__)
+
+
+def _append_lines(path, lines):
+    with open(path, 'a') as f:
+        f.write(lines)
+
+
+def _write_snapshot(snapshot_path, log_path, data):
+    tmp_path = snapshot_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, snapshot_path)
+    # Every logged entry is now part of the snapshot
+    if os.path.exists(log_path):
+        os.remove(log_path)
+
+
+class ButtonConfigStore:
+    """Process-wide button configuration store.
+
+    All reads are served from memory. Writes update memory immediately and are
+    persisted by a background flusher: changed entries are appended to a
+    JSON-lines change log, and the log is periodically compacted into the
+    snapshot file with an atomic rename.
+
+    Under eventlet monkey patching the flusher is a green thread, so the disk
+    writes (and serializing the snapshot) run in eventlet's OS thread pool
+    rather than stalling every socket on the hub.
+    """
+
+    def __init__(self, snapshot_path, log_path=None, flush_interval=0.5,
+                 min_compact_entries=1000, persist=True):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path or os.path.splitext(snapshot_path)[0] + '.log'
+        self.flush_interval = flush_interval
+        self.min_compact_entries = min_compact_entries
+        self.persist = persist
+
+        self._data = {}
+        self._pending = {}
+        self._log_entries = 0
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher = None
+        self._closed = False
+
+        self._load()
+        atexit.register(self.close)
+
+    def _load(self):
+        """Load the snapshot and replay the change log on top of it."""
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r') as f:
+                self._data = json.load(f)
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn final line from an interrupted append
+                        logger.warning(f"Skipping corrupt entry in {self.log_path}")
+                        continue
+                    self._data[entry['id']] = entry['config']
+                    self._log_entries += 1
+
+    def get(self, button_id, default=None):
+        """Return the configuration for a single button."""
+        return self._data.get(button_id, default)
+
+    def get_all(self):
+        """Return a shallow copy of all button configurations."""
+        with self._lock:
+            return dict(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def set(self, button_id, config):
+        """Store a button configuration and schedule it for persistence."""
+        with self._lock:
+            self._data[button_id] = config
+            if self.persist:
+                # Only the latest config per button is written at flush time
+                self._pending[button_id] = config
+        if self.persist:
+            self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        if self._flusher is None and not self._closed:
+            self._flusher = threading.Thread(target=self._run_flusher,
+                                             name='button-config-flusher',
+                                             daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing button configuration: {str(e)}")
+
+    def flush(self):
+        """Append pending changes to the change log, compacting if it grew too long."""
+        with self._io_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            lines = ''.join(json.dumps({'id': button_id, 'config': config},
+                                       separators=(',', ':')) + '\n'
+                            for button_id, config in pending.items())
+            self._offload(_append_lines, self.log_path, lines)
+            self._log_entries += len(pending)
+
+            # Compact once the log outgrows the live data set, so each write
+            # costs amortised O(1) regardless of how many buttons exist
+            if self._log_entries >= max(self.min_compact_entries, len(self._data)):
+                self._compact()
+
+    def compact(self):
+        """Flush pending changes and rewrite the snapshot file."""
+        self.flush()
+        with self._io_lock:
+            self._compact()
+
+    def _compact(self):
+        data = self.get_all()
+        self._offload(_write_snapshot, self.snapshot_path, self.log_path, data)
+        self._log_entries = 0
+        logger.info(f"Compacted button configuration ({len(data)} buttons)")
+
+    def _offload(self, func, *args):
+        # Once closed (e.g. at exit) block instead: no new pool threads then
+        if tpool is not None and not self._closed and patcher.is_monkey_patched('thread'):
+            return tpool.execute(func, *args)
+        return func(*args)
+
+    def close(self):
+        """Stop the flusher and persist everything to the snapshot."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        if self.persist and (self._pending or self._log_entries):
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Error persisting button configuration: {str(e)}")
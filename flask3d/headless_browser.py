@@ -0,0 +1,544 @@
+"""Headless browser capture for the 3D panels (Roadmap 1.2).
+
+Pages are rendered by a bounded pool of worker processes so the eventlet hub
+never blocks on a browser. Finished captures are kept in a content-addressed
+cache keyed by URL and viewport, with TTL and LRU eviction. Streams re-capture
+a page at an interval and send only the tiles that changed since the previous
+frame, with periodic keyframes.
+
+The renderer runs inside the worker processes and is chosen by import path
+(``module:Class``); the default uses Playwright's Chromium, which must be
+installed separately (``pip install playwright && playwright install chromium``).
+Tile diffs need Pillow; without it a stream only skips frames that are
+byte-for-byte identical and sends every other frame as a keyframe.
+
+Only hosts matching ``CAPTURE_ALLOWED_HOSTS`` (comma-separated, ``*``
+wildcards; localhost by default) are rendered, so the endpoint cannot be used
+to reach arbitrary internal addresses. Renderers are constructed with
+``timeout`` and ``allowed_hosts`` keyword arguments and should refuse
+navigations (redirects, frames) to other hosts as well.
+"""
+import io
+import os
+import sys
+import time
+import uuid
+import socket
+import hashlib
+import logging
+import importlib
+import fnmatch
+import threading
+import subprocess
+from collections import OrderedDict
+from multiprocessing.connection import Connection
+from urllib.parse import urlparse
+
+from eventlet.hubs import trampoline
+from eventlet.semaphore import Semaphore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RENDERER = 'headless_browser:PlaywrightRenderer'
+DEFAULT_ALLOWED_HOSTS = ('localhost', '127.0.0.1', '::1')
+FRAME_EVENT = 'capture_frame'
+
+
+class CaptureError(Exception):
+    """A page could not be rendered."""
+
+
+class CaptureUnavailable(CaptureError):
+    """The renderer cannot run in this environment (e.g. Playwright missing)."""
+
+
+def host_allowed(host, patterns):
+    """Return True if ``host`` matches one of the ``fnmatch`` patterns."""
+    host = (host or '').lower()
+    return bool(host) and any(fnmatch.fnmatchcase(host, pattern.lower()) for pattern in patterns)
+
+
+class PlaywrightRenderer:
+    """Render pages with Playwright's headless Chromium."""
+
+    def __init__(self, timeout=30.0, allowed_hosts=DEFAULT_ALLOWED_HOSTS):
+        try:
+            from playwright.sync_api import sync_playwright
+        except ImportError:
+            raise CaptureUnavailable('Headless capture requires the playwright package')
+        self.timeout_ms = timeout * 1000
+        self.allowed_hosts = allowed_hosts
+        self._playwright = sync_playwright().start()
+        self._browser = self._playwright.chromium.launch()
+        self._pages = {}
+
+    def screenshot(self, url, width, height, full_page=False, page_key=None):
+        """Return a PNG of ``url``; pages with a ``page_key`` stay open between calls."""
+        page = self._pages.get(page_key) if page_key is not None else None
+        if page is None:
+            page = self._browser.new_page(viewport={'width': width, 'height': height})
+            page.route('**/*', self._guard_navigation)
+            page.goto(url, wait_until='load', timeout=self.timeout_ms)
+            if page_key is not None:
+                self._pages[page_key] = page
+        try:
+            return page.screenshot(full_page=full_page, timeout=self.timeout_ms)
+        finally:
+            if page_key is None:
+                page.close()
+
+    def _guard_navigation(self, route, request):
+        # Redirects and frames must not lead the browser to other hosts
+        if (request.is_navigation_request() and urlparse(request.url).scheme != 'file'
+                and not host_allowed(urlparse(request.url).hostname, self.allowed_hosts)):
+            route.abort('blockedbyclient')
+        else:
+            route.continue_()
+
+    def close_page(self, page_key):
+        page = self._pages.pop(page_key, None)
+        if page is not None:
+            page.close()
+
+    def close(self):
+        self._browser.close()
+        self._playwright.stop()
+
+
+def load_renderer(spec, **kwargs):
+    """Instantiate a renderer from a ``module:Class`` import path."""
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)(**kwargs)
+
+
+def diff_tiles(png, previous_hashes, tile_size=128, keyframe_ratio=0.5):
+    """Split a PNG into tiles and return the ones whose hash changed.
+
+    Returns a frame dict with ``tile_hashes`` to pass back in for the next
+    frame. The frame is a keyframe (the whole image) when there is nothing to
+    diff against, the size changed, or more than ``keyframe_ratio`` of the
+    tiles changed.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        digest = hashlib.blake2b(png, digest_size=8).hexdigest()
+        if previous_hashes == [digest]:
+            return {'keyframe': False, 'tiles': [], 'tile_hashes': previous_hashes}
+        return {'keyframe': True, 'image': png, 'tiles': [], 'tile_hashes': [digest]}
+
+    image = Image.open(io.BytesIO(png)).convert('RGBA')
+    width, height = image.size
+    hashes = []
+    changed = []
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            box = (x, y, min(x + tile_size, width), min(y + tile_size, height))
+            tile = image.crop(box)
+            digest = hashlib.blake2b(tile.tobytes(), digest_size=8).hexdigest()
+            index = len(hashes)
+            hashes.append(digest)
+            if previous_hashes is None or index >= len(previous_hashes) or previous_hashes[index] != digest:
+                changed.append((box, tile))
+
+    frame = {'width': width, 'height': height, 'tile_size': tile_size, 'tile_hashes': hashes}
+    if (previous_hashes is None or len(previous_hashes) != len(hashes)
+            or len(changed) > keyframe_ratio * len(hashes)):
+        frame.update(keyframe=True, image=png, tiles=[])
+        return frame
+
+    tiles = []
+    for box, tile in changed:
+        buf = io.BytesIO()
+        tile.save(buf, format='PNG')
+        tiles.append({'x': box[0], 'y': box[1], 'w': box[2] - box[0],
+                      'h': box[3] - box[1], 'data': buf.getvalue()})
+    frame.update(keyframe=False, tiles=tiles)
+    return frame
+
+
+def _worker_main(conn, renderer_spec, timeout, allowed_hosts=DEFAULT_ALLOWED_HOSTS):
+    """Render jobs received over ``conn`` until told to stop."""
+    renderer = None
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            # The server went away
+            break
+        if job is None:
+            break
+        try:
+            if job.get('close_stream'):
+                if renderer is not None:
+                    renderer.close_page(job['close_stream'])
+                conn.send(('ok', None))
+                continue
+            if renderer is None:
+                renderer = load_renderer(renderer_spec, timeout=timeout,
+                                         allowed_hosts=allowed_hosts)
+            png = renderer.screenshot(job['url'], job['width'], job['height'],
+                                      full_page=job.get('full_page', False),
+                                      page_key=job.get('stream_id'))
+            if 'tile_hashes' in job:
+                result = diff_tiles(png, job['tile_hashes'], job.get('tile_size', 128))
+            else:
+                result = {'image': png}
+            conn.send(('ok', result))
+        except CaptureUnavailable as e:
+            conn.send(('unavailable', str(e)))
+        except Exception as e:
+            conn.send(('error', str(e)))
+    if renderer is not None:
+        renderer.close()
+
+
+class _Worker:
+    def __init__(self, renderer_spec, timeout, allowed_hosts):
+        parent_sock, child_sock = socket.socketpair()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), str(child_sock.fileno()),
+             renderer_spec, str(timeout), ','.join(allowed_hosts)],
+            pass_fds=[child_sock.fileno()]
+        )
+        child_sock.close()
+        # Green sockets are non-blocking; Connection expects a blocking fd and
+        # readiness is awaited with trampoline() before each recv
+        fd = parent_sock.detach()
+        os.set_blocking(fd, True)
+        self.conn = Connection(fd)
+        self.lock = Semaphore(1)
+
+    def kill(self):
+        self.process.kill()
+        self.conn.close()
+
+
+class RenderPool:
+    """Bounded pool of renderer processes driven without blocking the hub.
+
+    Workers are fresh interpreters running this module, so they inherit
+    neither the server's monkey-patched state nor its ``__main__``.
+    """
+
+    def __init__(self, size=2, renderer=DEFAULT_RENDERER, timeout=30.0,
+                 allowed_hosts=DEFAULT_ALLOWED_HOSTS):
+        self.size = size
+        self.renderer = renderer
+        self.timeout = timeout
+        self.allowed_hosts = tuple(allowed_hosts)
+        self.waiting = 0
+        self._workers = None
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._workers is None:
+                self._workers = [_Worker(self.renderer, self.timeout, self.allowed_hosts)
+                                 for _ in range(self.size)]
+
+    def render(self, job, worker=None):
+        """Run ``job`` on a worker and return its result.
+
+        ``worker`` pins the job to one worker, e.g. so a stream keeps reusing
+        the page it already has open.
+        """
+        self._start()
+        index = self._acquire(worker)
+        slot = self._workers[index]
+        try:
+            slot.conn.send(job)
+            trampoline(slot.conn.fileno(), read=True, timeout=self.timeout + 5,
+                       timeout_exc=CaptureError('Capture timed out'))
+            status, result = slot.conn.recv()
+        except (CaptureError, EOFError, OSError) as e:
+            # A hung or dead renderer: replace it so the slot stays usable
+            self._restart(index)
+            raise CaptureError(str(e) or 'Render worker exited')
+        finally:
+            slot.lock.release()
+        if status == 'unavailable':
+            raise CaptureUnavailable(result)
+        if status != 'ok':
+            raise CaptureError(result)
+        return result
+
+    def _acquire(self, worker=None):
+        if worker is not None:
+            index = worker % self.size
+        else:
+            for offset in range(self.size):
+                index = (self._next + offset) % self.size
+                if self._workers[index].lock.acquire(blocking=False):
+                    self._next = index + 1
+                    return index
+            index = self._next % self.size
+            self._next = index + 1
+        self.waiting += 1
+        try:
+            self._workers[index].lock.acquire()
+        finally:
+            self.waiting -= 1
+        return index
+
+    def _restart(self, index):
+        old = self._workers[index]
+        old.kill()
+        replacement = _Worker(self.renderer, self.timeout, self.allowed_hosts)
+        replacement.lock = old.lock
+        self._workers[index] = replacement
+
+    def close(self):
+        if self._workers is None:
+            return
+        for slot in self._workers:
+            try:
+                slot.conn.send(None)
+            except OSError:
+                pass
+            try:
+                slot.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                slot.kill()
+        self._workers = None
+
+
+class CaptureCache:
+    """Content-addressed capture cache with TTL and LRU eviction.
+
+    ``(url, viewport)`` keys map to the SHA-256 digest of the image; images are
+    stored once per digest so identical renders share memory.
+
+    With a ``blob_dir`` images are also written there as ``<digest>.png``, so
+    other worker processes can serve a digest this process rendered.
+    """
+
+    def __init__(self, ttl=60.0, max_entries=128, max_bytes=64 * 1024 * 1024, blob_dir=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.blob_dir = blob_dir
+        if blob_dir is not None:
+            os.makedirs(blob_dir, exist_ok=True)
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url, width, height, full_page=False):
+        return hashlib.sha256(f"{url}\n{width}x{height}\n{int(full_page)}".encode()).hexdigest()
+
+    def get(self, key):
+        """Return the digest cached for ``key``, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            digest, expires = entry
+            if expires < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return digest
+
+    def put(self, key, image):
+        """Store ``image`` under ``key`` and return its digest."""
+        digest = hashlib.sha256(image).hexdigest()
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            blob = self._blobs.get(digest)
+            if blob is None:
+                self._blobs[digest] = [image, 1]
+                self.size_bytes += len(image)
+                self._write_blob(digest, image)
+            else:
+                blob[1] += 1
+            self._entries[key] = (digest, time.monotonic() + self.ttl)
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self.size_bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+        return digest
+
+    def image(self, digest):
+        """Return the image bytes for ``digest``, or None."""
+        blob = self._blobs.get(digest)
+        if blob is not None:
+            return blob[0]
+        path = self._blob_path(digest)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _blob_path(self, digest):
+        # Digests come from URLs; anything but a SHA-256 hex digest is not ours
+        if self.blob_dir is None or len(digest) != 64 or digest.strip('0123456789abcdef'):
+            return None
+        return os.path.join(self.blob_dir, f'{digest}.png')
+
+    def _write_blob(self, digest, image):
+        path = self._blob_path(digest)
+        if path is None:
+            return
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(image)
+        os.replace(tmp_path, path)
+
+    def _drop(self, key):
+        digest, _ = self._entries.pop(key)
+        blob = self._blobs[digest]
+        blob[1] -= 1
+        if blob[1] == 0:
+            del self._blobs[digest]
+            self.size_bytes -= len(blob[0])
+            path = self._blob_path(digest)
+            if path is not None:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+class CaptureService:
+    """Cached one-shot captures and per-client capture streams."""
+
+    def __init__(self, socketio, pool, cache, allowed_schemes=('http', 'https'),
+                 allowed_hosts=DEFAULT_ALLOWED_HOSTS, max_streams_per_client=4,
+                 tile_size=128, keyframe_every=30):
+        self.socketio = socketio
+        self.pool = pool
+        self.cache = cache
+        self.allowed_schemes = allowed_schemes
+        self.allowed_hosts = allowed_hosts
+        self.max_streams_per_client = max_streams_per_client
+        self.tile_size = tile_size
+        self.keyframe_every = keyframe_every
+        self._streams = {}
+
+    def validate(self, url, width, height):
+        """Raise ValueError for URLs and viewports the service will not render."""
+        parsed = urlparse(url or '')
+        if parsed.scheme not in self.allowed_schemes:
+            raise ValueError(f"URL scheme must be one of: {', '.join(self.allowed_schemes)}")
+        if parsed.scheme != 'file' and not host_allowed(parsed.hostname, self.allowed_hosts):
+            raise ValueError(f"Host {parsed.hostname} is not in CAPTURE_ALLOWED_HOSTS")
+        if not (0 < width <= 4096 and 0 < height <= 4096):
+            raise ValueError('Viewport must be between 1x1 and 4096x4096')
+
+    def capture(self, url, width=1280, height=720, full_page=False):
+        """Return ``(digest, cached)`` for a capture of ``url`` at the given viewport."""
+        self.validate(url, width, height)
+        key = self.cache.key(url, width, height, full_page)
+        digest = self.cache.get(key)
+        if digest is not None:
+            return digest, True
+        result = self.pool.render({'url': url, 'width': width, 'height': height,
+                                   'full_page': full_page})
+        return self.cache.put(key, result['image']), False
+
+    def start_stream(self, sid, stream_id, url, width=1280, height=720, interval=1.0):
+        """Start pushing frames of ``url`` to client ``sid``."""
+        self.validate(url, width, height)
+        streams = self._streams.setdefault(sid, {})
+        if stream_id in streams:
+            self.stop_stream(sid, stream_id)
+        if len(streams) >= self.max_streams_per_client:
+            raise ValueError(f"At most {self.max_streams_per_client} capture streams per client")
+        # Each start gets its own page, so a restarted stream never shares (or
+        # closes) the page of the run it replaced
+        stream = {'active': True, 'token': uuid.uuid4().hex[:8]}
+        streams[stream_id] = stream
+        self.socketio.start_background_task(self._run_stream, sid, stream_id, stream,
+                                            url, width, height, max(interval, 0.1))
+
+    def stop_stream(self, sid, stream_id):
+        stream = self._streams.get(sid, {}).pop(stream_id, None)
+        if stream is not None:
+            stream['active'] = False
+
+    def stop_all(self, sid):
+        """Stop every stream of a disconnected client."""
+        for stream in self._streams.pop(sid, {}).values():
+            stream['active'] = False
+
+    def _run_stream(self, sid, stream_id, stream, url, width, height, interval):
+        page_key = f"{sid}:{stream_id}:{stream['token']}"
+        # Keep the stream on one worker so its page stays open between frames
+        worker = hash(page_key)
+        tile_hashes = None
+        seq = 0
+        try:
+            while stream['active']:
+                started = time.monotonic()
+                if seq % self.keyframe_every == 0:
+                    # Periodic keyframe so clients can recover from lost tiles
+                    tile_hashes = None
+                try:
+                    frame = self.pool.render({
+                        'url': url, 'width': width, 'height': height,
+                        'stream_id': page_key, 'tile_hashes': tile_hashes,
+                        'tile_size': self.tile_size
+                    }, worker=worker)
+                except CaptureError as e:
+                    logger.error(f"Capture stream {stream_id} failed: {str(e)}")
+                    self.socketio.emit(FRAME_EVENT, {'stream_id': stream_id, 'status': 'error',
+                                                     'message': str(e)}, to=sid, ignore_queue=True)
+                    break
+
+                tile_hashes = frame.pop('tile_hashes')
+                if frame['keyframe'] or frame['tiles']:
+                    seq += 1
+                    frame.update(stream_id=stream_id, seq=seq, status='success')
+                    # Local client only: keyframes must not be relayed to every worker
+                    self.socketio.emit(FRAME_EVENT, frame, to=sid, ignore_queue=True)
+                self.socketio.sleep(max(0.0, interval - (time.monotonic() - started)))
+        finally:
+            # A restart with the same stream_id has already replaced this entry
+            if self._streams.get(sid, {}).get(stream_id) is stream:
+                self.stop_stream(sid, stream_id)
+            try:
+                self.pool.render({'close_stream': page_key}, worker=worker)
+            except CaptureError:
+                pass
+
+
+def create_capture_service(socketio, blob_dir=None):
+    """Build the capture service from ``CAPTURE_*`` environment variables.
+
+    ``blob_dir`` is the default for ``CAPTURE_BLOB_DIR``, the directory that
+    shares rendered images between worker processes.
+    """
+    timeout = float(os.environ.get('CAPTURE_TIMEOUT', 30))
+    allowed_hosts = tuple(
+        host.strip() for host in os.environ.get('CAPTURE_ALLOWED_HOSTS', ','.join(DEFAULT_ALLOWED_HOSTS)).split(',')
+        if host.strip()
+    )
+    pool = RenderPool(
+        size=int(os.environ.get('CAPTURE_WORKERS', 2)),
+        renderer=os.environ.get('CAPTURE_RENDERER', DEFAULT_RENDERER),
+        timeout=timeout,
+        allowed_hosts=allowed_hosts
+    )
+    cache = CaptureCache(
+        ttl=float(os.environ.get('CAPTURE_CACHE_TTL', 60)),
+        max_entries=int(os.environ.get('CAPTURE_CACHE_ENTRIES', 128)),
+        max_bytes=int(os.environ.get('CAPTURE_CACHE_BYTES', 64 * 1024 * 1024)),
+        blob_dir=os.environ.get('CAPTURE_BLOB_DIR') or blob_dir
+    )
+    schemes = ('http', 'https', 'file') if os.environ.get('CAPTURE_ALLOW_FILE_URLS') == '1' else ('http', 'https')
+    return CaptureService(socketio, pool, cache, allowed_schemes=schemes, allowed_hosts=allowed_hosts)
+
+
+if __name__ == '__main__':
+    # Render worker entry point: <socket fd> <renderer spec> <timeout> <allowed hosts>
+    import headless_browser
+    os.set_blocking(int(sys.argv[1]), True)
+    headless_browser._worker_main(Connection(int(sys.argv[1])), sys.argv[2], float(sys.argv[3]),
+                                  tuple(filter(None, sys.argv[4].split(','))))
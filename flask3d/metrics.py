@@ -0,0 +1,258 @@
+"""Low-overhead instrumentation exposed in the Prometheus text format.
+
+Modules define their metrics at import time on the shared :data:`registry`,
+the same way they create a module-level logger::
+
+    FRAMES = registry.counter('flask3d_frames_total', 'Frames sent', ['format'])
+    FRAMES.inc('json')
+
+Counters are always exact. Latency histograms only time a random sample of
+calls (``registry.sample_rate``), so an unsampled call costs one
+``random()``. Gauges for queue depths and client counts are read from
+callbacks when ``/metrics`` is scraped, so nothing on the hot path updates
+them.
+
+Each worker process keeps its own registry; in multi-worker mode every
+series carries a ``worker`` label.
+"""
+import time
+import random
+import logging
+import functools
+import threading
+from bisect import bisect_left
+
+from flask import Response, request
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers sub-millisecond handlers up to slow renders
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing count, optionally split by label values."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, self.labelnames, labels, value
+
+
+class Gauge:
+    """Current value read from ``callback()`` at scrape time.
+
+    The callback returns a number, or ``{label values tuple: number}`` for a
+    gauge with labels.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, callback=None, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    def samples(self):
+        value = self.callback() if self.callback is not None else self._value
+        if not isinstance(value, dict):
+            value = {(): value}
+        for labels, number in value.items():
+            yield self.name, self.labelnames, labels, number
+
+
+class Histogram:
+    """Bucketed distribution of observed values."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        names = self.labelnames + ('le',)
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', names, labels + (_format_value(bound),), cumulative
+            yield f'{self.name}_sum', self.labelnames, labels, total
+            yield f'{self.name}_count', self.labelnames, labels, cumulative
+
+
+class MetricsRegistry:
+    """Named metrics plus the sampling policy for timers."""
+
+    def __init__(self, sample_rate=1.0):
+        self.sample_rate = sample_rate
+        self.const_labels = {}
+        self._metrics = {}
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, callback=None, labelnames=()):
+        gauge = self._register(Gauge(name, documentation, callback, labelnames))
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def sampled(self):
+        """Return True if the current call should be timed."""
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def timed(self, histogram, counter, *labels):
+        """Decorate a function to count every call and time a sample of them."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                counter.inc(*labels)
+                if not self.sampled():
+                    return func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started, *labels)
+            return wrapper
+        return decorator
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        const_names = tuple(self.const_labels)
+        const_values = tuple(self.const_labels.values())
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            try:
+                for name, labelnames, labels, value in metric.samples():
+                    label_text = _format_labels(const_names + labelnames, const_values + labels)
+                    lines.append(f'{name}{label_text} {_format_value(value)}')
+            except Exception as e:
+                logger.error(f"Error collecting metric {metric.name}: {str(e)}")
+        return '\n'.join(lines) + '\n'
+
+    def watch_hub_lag(self, start_background_task, sleep, interval=0.5):
+        """Measure how late the event loop wakes a sleeping task, in a background task."""
+        lag_seconds = self.histogram(
+            'flask3d_event_loop_lag_seconds',
+            'Delay between a scheduled wake-up of the eventlet hub and when it ran',
+            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+        last_lag = self.gauge('flask3d_event_loop_lag_last_seconds',
+                              'Most recent eventlet hub lag measurement')
+
+        def run():
+            while True:
+                started = time.perf_counter()
+                sleep(interval)
+                lag = max(time.perf_counter() - started - interval, 0.0)
+                lag_seconds.observe(lag)
+                last_lag.set(lag)
+        return start_background_task(run)
+
+
+registry = MetricsRegistry()
+
+SOCKETIO_EVENTS = registry.counter(
+    'flask3d_socketio_events_total', 'Socket.IO events handled', ['event'])
+SOCKETIO_EVENT_SECONDS = registry.histogram(
+    'flask3d_socketio_event_duration_seconds', 'Socket.IO handler latency (sampled)', ['event'])
+HTTP_REQUESTS = registry.counter(
+    'flask3d_http_requests_total', 'HTTP requests handled', ['route', 'method', 'status'])
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'flask3d_http_request_duration_seconds', 'HTTP request latency (sampled)', ['route', 'method'])
+
+
+def instrument_event(event):
+    """Decorate a Socket.IO handler to count and time ``event``."""
+    return registry.timed(SOCKETIO_EVENT_SECONDS, SOCKETIO_EVENTS, event)
+
+
+def instrument_app(app):
+    """Count every request of ``app`` and time a sample of them by route."""
+    @app.before_request
+    def start_timer():
+        request.environ['flask3d.metrics_started'] = (
+            time.perf_counter() if registry.sampled() else None)
+
+    @app.after_request
+    def record_request(response):
+        # Label by URL rule, not path, to keep the number of series bounded
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_REQUESTS.inc(route, request.method, str(response.status_code))
+        started = request.environ.get('flask3d.metrics_started')
+        if started is not None:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method)
+        return response
+
+
+def metrics_response():
+    """Return the registry as a ``/metrics`` response."""
+    return Response(registry.render(), content_type=CONTENT_TYPE)
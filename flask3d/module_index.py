@@ -0,0 +1,351 @@
+"""Incremental index of the static JS module graph.
+
+The index stats the static folder and only re-reads files whose mtime or size
+changed. From the parsed import specifiers it keeps the resolved static and
+dynamic import graph, each module's depth from the entrypoints, transitive
+sizes and the modules no entrypoint can reach. A ready-to-serve JSON report is
+rebuilt whenever something changes, so reading it is O(1).
+
+The asset pipeline is driven by the same index (sources, fingerprint order,
+preload order), and :meth:`ModuleIndex.watch` keeps both up to date.
+"""
+import os
+import re
+import json
+import logging
+import posixpath
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+MODULE_EXTENSIONS = ('.js', '.mjs')
+
+STATIC_IMPORT = re.compile(
+    r"""(?:\bimport\b[^'"();]*?\bfrom|\bexport\b[^'"();]*?\bfrom|\bimport)\s*(['"])([^'"\n]+)\1"""
+)
+DYNAMIC_IMPORT = re.compile(r"""\bimport\s*\(\s*(['"`])([^'"`\n]+)\1\s*\)""")
+ANY_DYNAMIC_IMPORT = re.compile(r"""\bimport\s*\(""")
+
+
+def strip_comments(source):
+    """Blank out JS comments, leaving strings and line numbers intact."""
+    out = []
+    i = 0
+    n = len(source)
+    quote = None
+    while i < n:
+        c = source[i]
+        if quote:
+            out.append(c)
+            if c == '\\' and i + 1 < n:
+                out.append(source[i + 1])
+                i += 2
+                continue
+            if c == quote:
+                quote = None
+            i += 1
+        elif c in '\'"`':
+            quote = c
+            out.append(c)
+            i += 1
+        elif source.startswith('//', i):
+            end = source.find('\n', i)
+            i = n if end == -1 else end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+            out.append('\n' * source.count('\n', i, end))
+            i = end
+        else:
+            out.append(c)
+            i += 1
+    return ''.join(out)
+
+
+def mask_strings(text):
+    """Replace the contents of string literals with ``x``, keeping every offset."""
+    out = list(text)
+    i = 0
+    n = len(text)
+    quote = None
+    while i < n:
+        c = text[i]
+        if quote:
+            if c == '\\' and i + 1 < n:
+                out[i] = 'x'
+                if text[i + 1] != '\n':
+                    out[i + 1] = 'x'
+                i += 2
+                continue
+            if c == quote:
+                quote = None
+            elif c != '\n':
+                out[i] = 'x'
+        elif c in '\'"`':
+            quote = c
+        i += 1
+    return ''.join(out)
+
+
+def parse_imports(source):
+    """Return ``(static, dynamic, unresolved_dynamic)`` import specifiers of a module."""
+    text = strip_comments(source)
+    # Match on masked strings so import-like text inside a string is ignored,
+    # then read each specifier back from the same offsets
+    masked = mask_strings(text)
+    dynamic = [text[m.start(2):m.end(2)] for m in DYNAMIC_IMPORT.finditer(masked)]
+    # Template literals with substitutions can't be resolved statically
+    dynamic = [spec for spec in dynamic if '${' not in spec]
+    unresolved = len(ANY_DYNAMIC_IMPORT.findall(masked)) - len(dynamic)
+    # import('x') also matches the bare-import form of the static pattern
+    masked = DYNAMIC_IMPORT.sub(lambda m: ' ' * len(m.group(0)), masked)
+    static = [text[m.start(2):m.end(2)] for m in STATIC_IMPORT.finditer(masked)]
+    return list(dict.fromkeys(static)), list(dict.fromkeys(dynamic)), unresolved
+
+
+def strongly_connected(graph):
+    """Tarjan's algorithm; components come out dependencies first."""
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+    counter = 0
+
+    for root in sorted(graph):
+        if root in index:
+            continue
+        # Iterative DFS so deep import chains cannot hit the recursion limit
+        work = [(root, iter(sorted(graph.get(root, ()))))]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, deps = work[-1]
+            for dep in deps:
+                if dep not in index:
+                    index[dep] = low[dep] = counter
+                    counter += 1
+                    stack.append(dep)
+                    on_stack.add(dep)
+                    work.append((dep, iter(sorted(graph.get(dep, ())))))
+                    break
+                if dep in on_stack:
+                    low[node] = min(low[node], index[dep])
+            else:
+                work.pop()
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(sorted(component))
+    return components
+
+
+class ModuleIndex:
+    """Module graph of the files under ``root``, refreshed from file mtimes."""
+
+    def __init__(self, root, url_prefix='/static', extensions=MODULE_EXTENSIONS + ('.css',),
+                 entrypoints=('js/main.js',)):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+        self.extensions = extensions
+        self.entrypoints = list(entrypoints)
+        self.generation = 0
+        self.report_json = '{}'
+
+        self._files = {}
+        self._graph = {}
+        self._depth = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """Call ``callback(index)`` after every refresh that changed something."""
+        self._listeners.append(callback)
+
+    def paths(self):
+        return list(self._files)
+
+    def source(self, path):
+        """Return the raw bytes of an indexed file."""
+        return self._files[path]['source']
+
+    def imports(self, path, dynamic=True):
+        """Return the indexed modules ``path`` imports directly."""
+        entry = self._files.get(path)
+        if entry is None:
+            return []
+        return entry['static'] + entry['dynamic'] if dynamic else list(entry['static'])
+
+    def graph(self, dynamic=True):
+        """Return ``{path: [imported paths]}`` for every indexed file."""
+        return {path: self.imports(path, dynamic) for path in self._files}
+
+    def dead_modules(self):
+        """Return the modules no entrypoint reaches through static or dynamic imports."""
+        return sorted(path for path in self._files
+                      if path.endswith(MODULE_EXTENSIONS) and path not in self._depth)
+
+    def preload_order(self, entry):
+        """Return ``entry``'s static import graph, dependencies first."""
+        order = []
+        seen = set()
+        stack = [(entry, iter(self.imports(entry, dynamic=False)))]
+        seen.add(entry)
+        while stack:
+            path, deps = stack[-1]
+            for dep in deps:
+                if dep not in seen:
+                    seen.add(dep)
+                    stack.append((dep, iter(self.imports(dep, dynamic=False))))
+                    break
+            else:
+                stack.pop()
+                if path in self._files:
+                    order.append(path)
+        return order
+
+    def refresh(self):
+        """Re-read changed files and rebuild the graph; return True if anything changed."""
+        with self._lock:
+            seen = set()
+            changed = False
+            if os.path.isdir(self.root):
+                for dirpath, _, filenames in os.walk(self.root):
+                    for filename in filenames:
+                        if not filename.endswith(self.extensions):
+                            continue
+                        full_path = os.path.join(dirpath, filename)
+                        path = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                        seen.add(path)
+                        try:
+                            stat = os.stat(full_path)
+                        except FileNotFoundError:
+                            seen.discard(path)
+                            continue
+                        entry = self._files.get(path)
+                        if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                            continue
+                        self._files[path] = self._parse(path, full_path, stat)
+                        changed = True
+            for path in set(self._files) - seen:
+                del self._files[path]
+                changed = True
+
+            if changed or self.generation == 0:
+                self._rebuild()
+        if changed:
+            for callback in self._listeners:
+                try:
+                    callback(self)
+                except Exception as e:
+                    logger.error(f"Error handling module index update: {str(e)}")
+        return changed
+
+    def _parse(self, path, full_path, stat):
+        with open(full_path, 'rb') as f:
+            source = f.read()
+        entry = {'mtime_ns': stat.st_mtime_ns, 'size': len(source), 'source': source,
+                 'specifiers': ([], [], 0)}
+        if path.endswith(MODULE_EXTENSIONS):
+            entry['specifiers'] = parse_imports(source.decode('utf-8', errors='replace'))
+        return entry
+
+    def _resolve(self, path, spec):
+        """Map an import specifier to an indexed path, or None for external modules."""
+        if spec.startswith(('./', '../')):
+            return posixpath.normpath(posixpath.join(posixpath.dirname(path), spec))
+        if spec.startswith(self.url_prefix + '/'):
+            return spec[len(self.url_prefix) + 1:]
+        return None
+
+    def _rebuild(self):
+        for path, entry in self._files.items():
+            static, dynamic, unresolved = entry['specifiers']
+            entry['static'] = []
+            entry['dynamic'] = []
+            entry['external'] = []
+            entry['unresolved_dynamic'] = unresolved
+            for kind, specs in (('static', static), ('dynamic', dynamic)):
+                for spec in specs:
+                    target = self._resolve(path, spec)
+                    if target in self._files:
+                        entry[kind].append(target)
+                    else:
+                        entry['external'].append(spec)
+
+        # Breadth-first depth from the entrypoints over static and dynamic edges
+        self._depth = {}
+        queue = deque()
+        for entry_path in self.entrypoints:
+            if entry_path in self._files:
+                self._depth[entry_path] = 0
+                queue.append(entry_path)
+        while queue:
+            path = queue.popleft()
+            for dep in self.imports(path):
+                if dep not in self._depth:
+                    self._depth[dep] = self._depth[path] + 1
+                    queue.append(dep)
+
+        self.generation += 1
+        self.report_json = json.dumps(self._build_report())
+
+    def _build_report(self):
+        # Transitive closures per strongly connected component, dependencies first
+        graph = self.graph()
+        closure = {}
+        for component in strongly_connected(graph):
+            reach = set(component)
+            for path in component:
+                for dep in graph[path]:
+                    if dep not in reach:
+                        reach |= closure[dep]
+            for path in component:
+                closure[path] = reach
+
+        modules = []
+        for path in sorted(self._files):
+            if not path.endswith(MODULE_EXTENSIONS):
+                continue
+            entry = self._files[path]
+            transitive = closure[path] - {path}
+            modules.append({
+                'name': path,
+                'size': entry['size'],
+                'imports': entry['static'],
+                'dynamic_imports': entry['dynamic'],
+                'external_imports': entry['external'],
+                'unresolved_dynamic_imports': entry['unresolved_dynamic'],
+                'transitive_imports': len(transitive),
+                'transitive_size': entry['size'] + sum(self._files[dep]['size'] for dep in transitive),
+                'depth': self._depth.get(path),
+            })
+        depths = [depth for depth in self._depth.values()]
+        return {
+            'generation': self.generation,
+            'entrypoints': self.entrypoints,
+            'modules': modules,
+            'max_depth': max(depths) if depths else None,
+            'dead_modules': self.dead_modules(),
+        }
+
+    def watch(self, start_background_task, sleep, interval=1.0):
+        """Poll for changes every ``interval`` seconds in a background task."""
+        def run():
+            while True:
+                sleep(interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"Error refreshing module index: {str(e)}")
+        return start_background_task(run)
@@ -0,0 +1,344 @@
+"""Pluggable pub/sub backends for sharing state and broadcasts between workers.
+
+Every backend delivers messages to all subscribers of a channel, including
+the publishing process, in one total order per channel, and stamps each
+message with a monotonically increasing sequence number. The sequence number
+doubles as the shared scene version across workers. ``publish`` returns it
+when it is known; ``publish(..., wait=True)`` waits for it where the backend
+only learns it after a round trip.
+
+Backends are selected by URL (see :func:`create_backend`):
+
+- ``local://`` -- in-process loopback, for single-worker mode
+- ``unix:///path/to/broker.sock`` -- the stand-in broker in this module
+- ``redis://host:port/db`` -- Redis, if the ``redis`` package is installed
+
+Run the stand-in broker with ``python pubsub.py /tmp/flask3d-broker.sock``.
+"""
+import os
+import sys
+import uuid
+import pickle
+import socket
+import struct
+import logging
+import itertools
+import selectors
+import threading
+
+import socketio
+
+logger = logging.getLogger(__name__)
+
+LENGTH = struct.Struct('!I')
+
+
+class LocalBackend:
+    """In-process backend that dispatches synchronously to local subscribers."""
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:12]
+        self._subscribers = {}
+        self._seq = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, callback):
+        """Call ``callback(seq, data)`` for every message on ``channel``."""
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    def publish(self, channel, data, wait=False):
+        with self._lock:
+            seq = self._seq[channel] = self._seq.get(channel, 0) + 1
+            for callback in self._subscribers.get(channel, ()):
+                callback(seq, data)
+        return seq
+
+
+def _send_frame(sock, payload):
+    sock.sendall(LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, size):
+    buf = b''
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError('Connection closed by peer')
+        buf += chunk
+    return buf
+
+
+def _recv_frame(sock):
+    size, = LENGTH.unpack(_recv_exact(sock, LENGTH.size))
+    return _recv_exact(sock, size)
+
+
+class UnixSocketBackend:
+    """Client for the stand-in :class:`UnixSocketBroker`.
+
+    The connection is opened lazily and reopened after ``fork()``, so a
+    backend created in the parent can be shared by worker processes.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._subscribers = {}
+        self._tickets = itertools.count(1)
+        self._waiting = {}
+        self._sock = None
+        self._pid = None
+        self._epoch = None
+        self._send_lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+
+    @property
+    def epoch(self):
+        self._connect()
+        return self._epoch
+
+    def _connect(self):
+        if self._sock is not None and self._pid == os.getpid():
+            return
+        with self._connect_lock:
+            if self._sock is not None and self._pid == os.getpid():
+                return
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            hello = pickle.loads(_recv_frame(sock))
+            self._epoch = hello['epoch']
+            self._sock = sock
+            self._pid = os.getpid()
+            threading.Thread(target=self._listen, args=(sock,),
+                             name='pubsub-listener', daemon=True).start()
+
+    def subscribe(self, channel, callback):
+        """Call ``callback(seq, data)`` for every message on ``channel``."""
+        self._subscribers.setdefault(channel, []).append(callback)
+        self._connect()
+
+    def publish(self, channel, data, wait=False):
+        """Send ``data`` to the broker; with ``wait``, return the sequence number it assigned.
+
+        Returns None without ``wait``, or if the broker did not answer within
+        ``timeout`` seconds.
+        """
+        self._connect()
+        ticket = None
+        if wait:
+            ticket = next(self._tickets)
+            waiter = self._waiting[ticket] = [threading.Event(), None]
+        payload = pickle.dumps((channel, data, ticket))
+        try:
+            with self._send_lock:
+                _send_frame(self._sock, payload)
+            if ticket is None:
+                return None
+            waiter[0].wait(self.timeout)
+            return waiter[1]
+        finally:
+            self._waiting.pop(ticket, None)
+
+    def _listen(self, sock):
+        while True:
+            try:
+                channel, seq, data = pickle.loads(_recv_frame(sock))
+            except (ConnectionError, OSError) as e:
+                logger.error(f"Lost connection to pub/sub broker: {str(e)}")
+                return
+            if channel is None:
+                # Ack of our own publish; sent after the message itself, so
+                # it has been applied here by the time the publisher resumes
+                waiter = self._waiting.get(data)
+                if waiter is not None:
+                    waiter[1] = seq
+                    waiter[0].set()
+                continue
+            for callback in self._subscribers.get(channel, ()):
+                try:
+                    callback(seq, data)
+                except Exception as e:
+                    logger.error(f"Error handling {channel} message: {str(e)}")
+
+
+class RedisBackend:
+    """Redis backend; sequence stamping and publishing happen in one Lua script."""
+
+    PUBLISH_SCRIPT = """
+        local seq = redis.call('INCR', KEYS[1])
+        redis.call('PUBLISH', ARGV[1], struct.pack('>I', seq) .. ARGV[2])
+        return seq
+    """
+
+    def __init__(self, url, prefix='flask3d'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('Redis backend requires the redis package')
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+        self._redis.setnx(f'{prefix}:epoch', uuid.uuid4().hex[:12])
+        self.epoch = self._redis.get(f'{prefix}:epoch').decode()
+        self._publish_script = self._redis.register_script(self.PUBLISH_SCRIPT)
+        self._subscribers = {}
+        self._pubsub = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, callback):
+        """Call ``callback(seq, data)`` for every message on ``channel``."""
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+            if self._pubsub is None:
+                self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(f'{self.prefix}:{channel}')
+                threading.Thread(target=self._listen, name='pubsub-listener',
+                                 daemon=True).start()
+            else:
+                self._pubsub.subscribe(f'{self.prefix}:{channel}')
+
+    def publish(self, channel, data, wait=False):
+        return self._publish_script(keys=[f'{self.prefix}:seq:{channel}'],
+                                    args=[f'{self.prefix}:{channel}', pickle.dumps(data)])
+
+    def _listen(self):
+        for message in self._pubsub.listen():
+            channel = message['channel'].decode()[len(self.prefix) + 1:]
+            seq, = LENGTH.unpack(message['data'][:LENGTH.size])
+            data = pickle.loads(message['data'][LENGTH.size:])
+            for callback in self._subscribers.get(channel, ()):
+                try:
+                    callback(seq, data)
+                except Exception as e:
+                    logger.error(f"Error handling {channel} message: {str(e)}")
+
+
+def create_backend(url=None):
+    """Create a pub/sub backend from a ``local://``, ``unix://`` or ``redis://`` URL."""
+    if not url or url.startswith('local:'):
+        return LocalBackend()
+    if url.startswith('unix://'):
+        return UnixSocketBackend(url[len('unix://'):])
+    if url.startswith(('redis://', 'rediss://', 'unix+redis://')):
+        return RedisBackend(url.replace('unix+redis://', 'unix://', 1))
+    raise ValueError(f"Unsupported pub/sub backend URL: {url}")
+
+
+class BackendManager(socketio.PubSubManager):
+    """Socket.IO client manager that shares emits over a pub/sub backend."""
+
+    name = 'backend'
+
+    def __init__(self, backend, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.backend = backend
+
+    def reset_host_id(self):
+        """Take a new identity; call in every worker after forking.
+
+        ``PubSubManager`` drops messages carrying its own ``host_id``, so
+        workers forked from one manager would otherwise ignore each other.
+        """
+        self.host_id = uuid.uuid4().hex
+
+    def _publish(self, data):
+        self.backend.publish(self.channel, data)
+
+    def _listen(self):
+        queue = self.server.eio.create_queue()
+        self.backend.subscribe(self.channel, lambda seq, data: queue.put(data))
+        while True:
+            yield queue.get()
+
+
+class UnixSocketBroker:
+    """Single-machine stand-in for Redis pub/sub.
+
+    Every frame received from a client is stamped with the next sequence
+    number for its channel and relayed to all connected clients. Frames sent
+    with a ticket are then acknowledged to their sender as
+    ``(None, seq, ticket)``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.epoch = uuid.uuid4().hex[:12]
+        self._seq = {}
+        self._buffers = {}
+        self._selector = selectors.DefaultSelector()
+
+    def serve_forever(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        server.listen()
+        self._selector.register(server, selectors.EVENT_READ)
+        logger.info(f"Pub/sub broker listening on {self.path}")
+        try:
+            while True:
+                for key, _ in self._selector.select():
+                    if key.fileobj is server:
+                        self._accept(server)
+                    else:
+                        self._read(key.fileobj)
+        finally:
+            server.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _accept(self, server):
+        conn, _ = server.accept()
+        try:
+            _send_frame(conn, pickle.dumps({'epoch': self.epoch}))
+        except OSError:
+            # Gone before the hello, e.g. a readiness probe
+            conn.close()
+            return
+        self._buffers[conn] = b''
+        self._selector.register(conn, selectors.EVENT_READ)
+
+    def _drop(self, conn):
+        self._selector.unregister(conn)
+        self._buffers.pop(conn, None)
+        conn.close()
+
+    def _read(self, conn):
+        try:
+            chunk = conn.recv(65536)
+        except OSError:
+            chunk = b''
+        if not chunk:
+            self._drop(conn)
+            return
+        buf = self._buffers[conn] + chunk
+        while len(buf) >= LENGTH.size:
+            size, = LENGTH.unpack_from(buf)
+            if len(buf) < LENGTH.size + size:
+                break
+            channel, data, ticket = pickle.loads(buf[LENGTH.size:LENGTH.size + size])
+            buf = buf[LENGTH.size + size:]
+            self._relay(channel, data, conn, ticket)
+        if conn in self._buffers:
+            self._buffers[conn] = buf
+
+    def _relay(self, channel, data, sender, ticket):
+        seq = self._seq[channel] = self._seq.get(channel, 0) + 1
+        payload = pickle.dumps((channel, seq, data))
+        for conn in list(self._buffers):
+            try:
+                _send_frame(conn, payload)
+            except OSError:
+                self._drop(conn)
+        if ticket is not None and sender in self._buffers:
+            try:
+                _send_frame(sender, pickle.dumps((None, seq, ticket)))
+            except OSError:
+                self._drop(sender)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    UnixSocketBroker(sys.argv[1] if len(sys.argv) > 1 else '/tmp/flask3d-broker.sock').serve_forever()
@@ -0,0 +1,131 @@
+import uuid
+import threading
+from collections import deque
+
+DELTA_EVENT = 'scene_delta'
+
+
+def flatten_config(config, prefix=''):
+    """Flatten nested config dicts into ``{'position.x': 1.0, ...}`` leaf paths."""
+    flat = {}
+    for key, value in config.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict) and value:
+            flat.update(flatten_config(value, path + '.'))
+        else:
+            flat[path] = value
+    return flat
+
+
+def diff_config(old, new):
+    """Return the leaf paths set and unset when going from ``old`` to ``new``."""
+    old_flat = flatten_config(old)
+    new_flat = flatten_config(new)
+    # The id is the delta's key, not one of its fields
+    old_flat.pop('id', None)
+    new_flat.pop('id', None)
+    changed = {path: value for path, value in new_flat.items()
+               if path not in old_flat or old_flat[path] != value}
+    removed = [path for path in old_flat if path not in new_flat]
+    return changed, removed
+
+
+def merge_deltas(older, newer):
+    """Combine two deltas for the same button into one equivalent delta."""
+    changed = {path: value for path, value in older.get('set', {}).items()
+               if path not in newer.get('unset', ())}
+    changed.update(newer.get('set', {}))
+    removed = [path for path in older.get('unset', ()) if path not in changed]
+    removed += [path for path in newer.get('unset', ()) if path not in removed]
+
+    merged = {'version': newer['version'], 'id': newer['id'], 'set': changed}
+    if removed:
+        merged['unset'] = removed
+    return merged
+
+
+class SceneState:
+    """Monotonically versioned view of the button scene.
+
+    Every accepted config change bumps the version and records a field-level
+    delta in a bounded ring buffer, so reconnecting clients can catch up from
+    their last known version without refetching the whole scene. The epoch
+    changes with every server start; versions from another epoch are
+    meaningless and force a full snapshot.
+
+    In multi-worker mode the pub/sub backend assigns versions and the epoch,
+    so every worker numbers the same change identically.
+    """
+
+    def __init__(self, store, history=1024):
+        self.store = store
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        # Oldest version the delta history can still bring a client up from
+        self._floor = 0
+        self._deltas = deque(maxlen=history)
+        self._lock = threading.RLock()
+
+    def apply(self, button_id, config, version=None):
+        """Store ``config`` and return its delta, or None if nothing changed.
+
+        ``version`` is the externally assigned version of this change; by
+        default the next local version is used.
+        """
+        with self._lock:
+            old = self.store.get(button_id)
+            changed, removed = diff_config(old or {}, config)
+            if version is not None:
+                if version != self.version + 1:
+                    # The backend's sequence need not start at 1 (it can outlive
+                    # this process) and may skip messages this worker never saw;
+                    # buffered deltas cannot bridge that gap
+                    self._floor = max(self._floor, version - 1)
+                self.version = version
+            if old is not None and not changed and not removed:
+                return None
+            if version is None:
+                self.version += 1
+
+            self.store.set(button_id, config)
+            delta = {'version': self.version, 'id': button_id, 'set': changed}
+            if removed:
+                delta['unset'] = removed
+            if len(self._deltas) == self._deltas.maxlen:
+                self._floor = max(self._floor, self._deltas[0]['version'])
+            self._deltas.append(delta)
+            return delta
+
+    def snapshot(self):
+        """Return the full scene tagged with its epoch and version."""
+        with self._lock:
+            return {
+                'epoch': self.epoch,
+                'version': self.version,
+                'buttons': self.store.get_all()
+            }
+
+    def deltas_since(self, version):
+        """Return the deltas after ``version``, or None if they are no longer buffered."""
+        with self._lock:
+            if version > self.version or version < self._floor:
+                return None
+            return [delta for delta in self._deltas if delta['version'] > version]
+
+    def sync_payload(self, epoch=None, version=None):
+        """Build the catch-up message for a client that last saw ``epoch``/``version``.
+
+        Returns ``('scene_deltas', payload)`` when the missing deltas are still
+        buffered, otherwise ``('scene_snapshot', payload)``.
+        """
+        if epoch == self.epoch and isinstance(version, int):
+            with self._lock:
+                deltas = self.deltas_since(version)
+                current = self.version
+            if deltas is not None:
+                return 'scene_deltas', {
+                    'epoch': self.epoch,
+                    'version': current,
+                    'deltas': deltas
+                }
+        return 'scene_snapshot', self.snapshot()
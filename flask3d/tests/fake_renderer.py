@@ -0,0 +1,27 @@
+"""Renderer for tests: draws the colour named in a file:// page instead of a browser."""
+import io
+from urllib.parse import urlparse
+
+from PIL import Image
+
+
+class FakeRenderer:
+    def __init__(self, timeout=30.0, allowed_hosts=()):
+        self.pages = set()
+
+    def screenshot(self, url, width, height, full_page=False, page_key=None):
+        with open(urlparse(url).path) as f:
+            color = f.read().strip()
+        if page_key is not None:
+            self.pages.add(page_key)
+        image = Image.new('RGB', (width, height), 'white')
+        image.paste(color, (0, 0, 64, 64))
+        buf = io.BytesIO()
+        image.save(buf, format='PNG')
+        return buf.getvalue()
+
+    def close_page(self, page_key):
+        self.pages.discard(page_key)
+
+    def close(self):
+        pass
@@ -0,0 +1,43 @@
+import re
+
+import pytest
+
+from assets import AssetPipeline
+from module_index import ModuleIndex
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'js' / 'main.js').write_text("import { a } from './a.js';\na();\n")
+    (tmp_path / 'js' / 'a.js').write_text(
+        "import { start } from './main.js';\nimport { util } from './util.js';\n"
+        "export function a() { util(start); }\n")
+    (tmp_path / 'js' / 'util.js').write_text("export function util(f) { return f; }\n")
+    index = ModuleIndex(str(tmp_path), entrypoints=['js/main.js'])
+    pipeline = AssetPipeline(index)
+    index.add_listener(lambda index: pipeline.build())
+    index.refresh()
+    return pipeline
+
+
+def body(pipeline, path):
+    return pipeline.lookup(path).variants['identity'].decode()
+
+
+def test_imports_are_rewritten_to_fingerprinted_names(pipeline):
+    util = pipeline.lookup('js/util.js').fingerprinted
+    assert re.fullmatch(r'js/util\.[0-9a-f]{8}\.js', util)
+    assert f"from './{util[3:]}'" in body(pipeline, 'js/a.js')
+    assert pipeline.lookup(util) is pipeline.lookup('js/util.js')
+
+
+def test_entrypoints_keep_their_plain_name(pipeline):
+    # The back-edge of the main <-> a cycle must name the module the page loads
+    assert "from './main.js'" in body(pipeline, 'js/a.js')
+    assert pipeline.url_for('js/main.js') == '/static/js/main.js'
+    assert pipeline.url_for('js/a.js') == f"/static/{pipeline.lookup('js/a.js').fingerprinted}"
+    header = pipeline.preload_header('js/main.js')
+    assert '</static/js/main.js>; rel=modulepreload' in header
+    assert 'main.' not in header.replace('main.js', '')
+
@@ -0,0 +1,198 @@
+from types import SimpleNamespace
+
+from broadcast import BATCH_EVENT, LEGACY, BroadcastScheduler
+from scene_state import DELTA_EVENT, merge_deltas
+
+
+class FakeQueue:
+    def __init__(self):
+        self.depth = 0
+
+    def qsize(self):
+        return self.depth
+
+
+class FakeServer:
+    def __init__(self):
+        self.rooms = {}
+        self.queues = {}
+        self.manager = SimpleNamespace(eio_sid_from_sid=lambda sid, namespace: sid)
+        self.eio = SimpleNamespace(sockets={})
+
+    def enter_room(self, sid, room, namespace=None):
+        self.rooms.setdefault(room, set()).add(sid)
+        self.eio.sockets[sid] = SimpleNamespace(queue=self.queues.setdefault(sid, FakeQueue()))
+
+    def leave_room(self, sid, room, namespace=None):
+        self.rooms.get(room, set()).discard(sid)
+
+
+class FakeSocketIO:
+    """Delivers room emits to each member; the ticker is driven by calling flush()."""
+
+    def __init__(self):
+        self.server = FakeServer()
+        self.emits = []
+        self.received = {}
+
+    def start_background_task(self, target, *args):
+        return object()
+
+    def emit(self, event, data, to=None, skip_sid=None, namespace=None, ignore_queue=False):
+        self.emits.append((event, to))
+        sids = self.server.rooms.get(to, {to})
+        for sid in sids - set(skip_sid or ()):
+            self.received.setdefault(sid, []).append((event, data))
+
+    def take(self, sid):
+        return self.received.pop(sid, [])
+
+
+def make_scheduler(**kwargs):
+    socketio = FakeSocketIO()
+    scheduler = BroadcastScheduler(socketio, **kwargs)
+    scheduler.set_merge(DELTA_EVENT, merge_deltas)
+    return socketio, scheduler
+
+
+def delta(version, **changed):
+    return {'version': version, 'id': 'b1', 'set': changed}
+
+
+def test_coalesces_to_latest_payload_per_key():
+    socketio, scheduler = make_scheduler()
+    scheduler.add_client('a')
+    scheduler.publish('button_state_changed', 'b1', {'id': 'b1', 'state': 'down'})
+    scheduler.publish('button_state_changed', 'b2', {'id': 'b2', 'state': 'down'})
+    scheduler.publish('button_state_changed', 'b1', {'id': 'b1', 'state': 'up'})
+    scheduler.flush()
+
+    [(event, frame)] = socketio.take('a')
+    assert event == BATCH_EVENT
+    assert frame['events']['button_state_changed'] == [
+        {'id': 'b2', 'state': 'down'}, {'id': 'b1', 'state': 'up'}]
+
+
+def test_merges_deltas_for_the_same_button():
+    socketio, scheduler = make_scheduler()
+    scheduler.add_client('a')
+    scheduler.publish(DELTA_EVENT, 'b1', delta(1, **{'position.x': 1, 'color': 'red'}))
+    scheduler.publish(DELTA_EVENT, 'b1', delta(2, **{'position.x': 2}))
+    scheduler.flush()
+
+    [(_, frame)] = socketio.take('a')
+    assert frame['events'][DELTA_EVENT] == [delta(2, **{'position.x': 2, 'color': 'red'})]
+
+
+def test_encodes_once_per_format():
+    socketio, scheduler = make_scheduler()
+    calls = []
+
+    def encode(seq, updates, catch_up=False):
+        calls.append(seq)
+        return {'seq': seq, 'packed': len(updates)}
+    scheduler.set_encoder('binary', encode)
+    for sid, wire_format in (('a', 'json'), ('b', 'json'), ('c', 'binary'), ('d', 'binary')):
+        scheduler.add_client(sid, wire_format)
+    scheduler.publish(DELTA_EVENT, 'b1', delta(1, **{'position.x': 1}))
+    scheduler.flush()
+
+    assert calls == [1]
+    assert len(socketio.emits) == 2
+    assert socketio.take('c') == socketio.take('d') == [(BATCH_EVENT, {'seq': 1, 'packed': 1})]
+    assert len(socketio.take('a')) == len(socketio.take('b')) == 1
+
+
+def test_defers_backed_up_clients_and_catches_them_up():
+    socketio, scheduler = make_scheduler(max_queued=2)
+    scheduler.add_client('fast')
+    scheduler.add_client('slow')
+    socketio.server.queues['slow'].depth = 2
+
+    scheduler.publish(DELTA_EVENT, 'b1', delta(1, **{'position.x': 1, 'color': 'red'}))
+    scheduler.flush()
+    scheduler.publish(DELTA_EVENT, 'b1', delta(2, **{'position.x': 2}))
+    scheduler.flush()
+    assert len(socketio.take('fast')) == 2
+    assert socketio.take('slow') == []
+
+    # Drained: the backlog arrives as one merged catch-up frame, and the
+    # shared frame of that tick skips the client
+    socketio.server.queues['slow'].depth = 0
+    scheduler.publish(DELTA_EVENT, 'b1', delta(3, color='blue'))
+    scheduler.flush()
+    [(_, frame)] = socketio.take('slow')
+    assert frame['events'][DELTA_EVENT] == [delta(3, **{'position.x': 2, 'color': 'blue'})]
+    [(_, frame)] = socketio.take('fast')
+    assert frame['events'][DELTA_EVENT] == [delta(3, color='blue')]
+
+    # Caught up: back on the shared frame
+    scheduler.publish(DELTA_EVENT, 'b1', delta(4, color='green'))
+    scheduler.flush()
+    assert len(socketio.take('slow')) == 1
+
+
+def test_legacy_clients_get_separate_translated_events_per_tick():
+    socketio, scheduler = make_scheduler()
+    scheduler.set_legacy(DELTA_EVENT, lambda d: ('button_config_updated', {'id': d['id']}))
+    scheduler.add_client('old', LEGACY)
+    scheduler.publish(DELTA_EVENT, 'b1', delta(1, **{'position.x': 1}))
+    scheduler.publish(DELTA_EVENT, 'b1', delta(2, **{'position.x': 2}))
+    scheduler.publish('button_state_changed', 'b1', {'id': 'b1', 'state': 'up'})
+    assert socketio.take('old') == []
+
+    scheduler.flush()
+    assert socketio.take('old') == [
+        ('button_config_updated', {'id': 'b1'}),
+        ('button_state_changed', {'id': 'b1', 'state': 'up'}),
+    ]
+
+    # Legacy clients are deferred like any other
+    socketio.server.queues['old'].depth = 8
+    scheduler.publish('button_state_changed', 'b1', {'id': 'b1', 'state': 'down'})
+    scheduler.flush()
+    assert socketio.take('old') == []
+    socketio.server.queues['old'].depth = 0
+    scheduler.flush()
+    assert socketio.take('old') == [('button_state_changed', {'id': 'b1', 'state': 'down'})]
+
+
+def test_failing_format_does_not_drop_the_tick_for_others():
+    socketio, scheduler = make_scheduler()
+
+    def broken(seq, updates, catch_up=False):
+        raise OverflowError('float too large to pack with f format')
+    scheduler.set_encoder('binary', broken)
+    scheduler.add_client('a', 'binary')
+    scheduler.add_client('b', 'json')
+    scheduler.publish('button_state_changed', 'b1', {'id': 'b1', 'state': 'up'})
+    scheduler.flush()
+
+    assert socketio.take('a') == []
+    assert len(socketio.take('b')) == 1
+
+
+def test_disabled_sends_each_update_encoded_per_format():
+    socketio, scheduler = make_scheduler(enabled=False)
+    scheduler.set_encoder('binary', lambda seq, updates, catch_up=False: {'seq': seq, 'binary': True})
+    scheduler.add_client('a', 'binary')
+    scheduler.add_client('b', 'json')
+    scheduler.publish('button_state_changed', 'b1', {'id': 'b1', 'state': 'up'})
+    scheduler.publish('button_state_changed', 'b1', {'id': 'b1', 'state': 'down'})
+
+    assert socketio.take('a') == [(BATCH_EVENT, {'seq': 1, 'binary': True}),
+                                  (BATCH_EVENT, {'seq': 2, 'binary': True})]
+    assert [frame['events'] for _, frame in socketio.take('b')] == [
+        {'button_state_changed': [{'id': 'b1', 'state': 'up'}]},
+        {'button_state_changed': [{'id': 'b1', 'state': 'down'}]},
+    ]
+
+
+def test_removed_clients_leave_their_room():
+    socketio, scheduler = make_scheduler()
+    scheduler.add_client('a')
+    scheduler.remove_client('a')
+    scheduler.publish('button_state_changed', 'b1', {'id': 'b1', 'state': 'up'})
+    scheduler.flush()
+    assert socketio.take('a') == []
+    assert scheduler.client_counts() == ({}, 0)
@@ -0,0 +1,141 @@
+import time
+
+import eventlet
+import pytest
+
+pytest.importorskip('PIL')
+
+from headless_browser import FRAME_EVENT, CaptureCache, CaptureService, RenderPool
+
+FAKE_RENDERER = 'tests.fake_renderer:FakeRenderer'
+
+
+class FakeSocketIO:
+    def __init__(self):
+        self.emitted = []
+
+    def start_background_task(self, target, *args):
+        return eventlet.spawn(target, *args)
+
+    def sleep(self, seconds):
+        eventlet.sleep(seconds)
+
+    def emit(self, event, data, to=None, ignore_queue=False):
+        self.emitted.append((event, data, to))
+
+
+def wait_for(condition, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        eventlet.sleep(0.05)
+
+
+@pytest.fixture
+def page(tmp_path):
+    path = tmp_path / 'page.html'
+    path.write_text('red')
+    return path
+
+
+@pytest.fixture
+def service():
+    pool = RenderPool(size=1, renderer=FAKE_RENDERER, timeout=10)
+    service = CaptureService(FakeSocketIO(), pool, CaptureCache(),
+                             allowed_schemes=('http', 'https', 'file'))
+    yield service
+    pool.close()
+
+
+def test_cache_expires_entries():
+    cache = CaptureCache(ttl=-1)
+    cache.put('k', b'png')
+    assert cache.get('k') is None
+
+
+def test_cache_evicts_least_recently_used():
+    cache = CaptureCache(max_entries=2)
+    first = cache.put('a', b'first')
+    cache.put('b', b'second')
+    cache.get('a')
+    cache.put('c', b'third')
+    assert cache.get('a') == first
+    assert cache.get('b') is None
+    assert cache.size_bytes == len(b'first') + len(b'third')
+
+
+def test_cache_shares_images_through_blob_dir(tmp_path):
+    owner = CaptureCache(max_entries=1, blob_dir=str(tmp_path))
+    other = CaptureCache(blob_dir=str(tmp_path))
+    digest = owner.put('a', b'image')
+    assert other.image(digest) == b'image'
+    assert other.image('../' + digest[3:]) is None
+
+    owner.put('b', b'other image')
+    assert other.image(digest) is None
+
+
+@pytest.mark.parametrize('url', [
+    'http://169.254.169.254/latest/meta-data',
+    'http://10.0.0.1/',
+    'ftp://localhost/',
+])
+def test_validate_rejects_urls_outside_the_allowlist(url):
+    service = CaptureService(FakeSocketIO(), None, CaptureCache())
+    with pytest.raises(ValueError):
+        service.validate(url, 640, 480)
+
+
+def test_validate_allows_localhost():
+    service = CaptureService(FakeSocketIO(), None, CaptureCache())
+    service.validate('http://localhost:8000/panel', 640, 480)
+    service.validate('http://[::1]/', 640, 480)
+
+
+def test_capture_renders_and_caches(service, page):
+    url = page.as_uri()
+    digest, cached = service.capture(url, width=128, height=128)
+    assert not cached
+    assert service.cache.image(digest).startswith(b'\x89PNG')
+    assert service.capture(url, width=128, height=128) == (digest, True)
+
+    other, cached = service.capture(url, width=256, height=128)
+    assert not cached
+    assert other != digest
+
+
+def test_stream_sends_changed_tiles(service, page):
+    emitted = service.socketio.emitted
+    service.start_stream('sid', 's1', page.as_uri(), width=256, height=256, interval=0.1)
+    wait_for(lambda: emitted)
+    event, frame, to = emitted[0]
+    assert (event, to) == (FRAME_EVENT, 'sid')
+    assert frame['keyframe'] and frame['seq'] == 1
+
+    # Unchanged frames are not sent; a changed corner sends one of four tiles
+    eventlet.sleep(0.3)
+    assert len(emitted) == 1
+    page.write_text('blue')
+    wait_for(lambda: len(emitted) > 1)
+    frame = emitted[1][1]
+    assert not frame['keyframe']
+    assert [(tile['x'], tile['y']) for tile in frame['tiles']] == [(0, 0)]
+    service.stop_all('sid')
+
+
+def test_restarted_stream_keeps_running(service, page):
+    emitted = service.socketio.emitted
+    service.start_stream('sid', 's1', page.as_uri(), width=64, height=64, interval=0.1)
+    wait_for(lambda: emitted)
+    service.start_stream('sid', 's1', page.as_uri(), width=64, height=64, interval=0.1)
+    restarted = service._streams['sid']['s1']
+    wait_for(lambda: len(emitted) > 1)
+
+    # The replaced run has exited by now; the new one must still be registered
+    eventlet.sleep(0.3)
+    assert service._streams['sid']['s1'] is restarted
+    assert restarted['active']
+    count = len(emitted)
+    page.write_text('green')
+    wait_for(lambda: len(emitted) > count)
+    service.stop_all('sid')
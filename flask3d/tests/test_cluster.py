@@ -0,0 +1,104 @@
+import os
+import time
+import shutil
+import tempfile
+
+import pytest
+
+from cluster import ClusterBridge, start_broker
+from pubsub import UnixSocketBackend
+from scene_state import DELTA_EVENT, SceneState
+
+
+class FakeStore:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, button_id, default=None):
+        return self.data.get(button_id, default)
+
+    def get_all(self):
+        return dict(self.data)
+
+    def set(self, button_id, config):
+        self.data[button_id] = config
+
+
+class RecordingBroadcaster:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, event, key, payload):
+        self.published.append((event, key, payload))
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def broker_path():
+    # Unix socket paths are limited to ~100 bytes, so keep it short
+    directory = tempfile.mkdtemp(prefix='f3d-')
+    path = os.path.join(directory, 'broker.sock')
+    broker = start_broker(path)
+    yield path
+    broker.terminate()
+    broker.wait(timeout=10)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def make_worker(path):
+    backend = UnixSocketBackend(path)
+    state = SceneState(FakeStore())
+    broadcaster = RecordingBroadcaster()
+    bridge = ClusterBridge(backend, state, broadcaster)
+    bridge.start()
+    return bridge, state, broadcaster.published
+
+
+def config(x):
+    return {'id': 'b1', 'position': {'x': x, 'y': 0, 'z': 0}, 'scale': 1}
+
+
+def test_workers_share_epoch_order_and_versions(broker_path):
+    (bridge_a, state_a, out_a), (bridge_b, state_b, out_b) = (
+        make_worker(broker_path), make_worker(broker_path))
+    assert state_a.epoch == state_b.epoch == bridge_a.backend.epoch
+
+    # Alternate publishers; each change returns the version the broker assigned
+    versions = []
+    for x in range(1, 7):
+        bridge = bridge_a if x % 2 else bridge_b
+        versions.append(bridge.submit_config('b1', config(x)))
+        bridge.publish('button_state_changed', 'b1', {'id': 'b1', 'state': f'click-{x}'})
+    assert versions == [1, 2, 3, 4, 5, 6]
+
+    wait_for(lambda: len(out_a) == len(out_b) == 12)
+    # Both workers apply and broadcast every change in the same order
+    assert out_a == out_b
+    deltas = [payload for event, _, payload in out_a if event == DELTA_EVENT]
+    assert [d['version'] for d in deltas] == versions
+    assert [d['set']['position.x'] for d in deltas] == [1, 2, 3, 4, 5, 6]
+    states = [payload['state'] for event, _, payload in out_a if event != DELTA_EVENT]
+    assert states == [f'click-{x}' for x in range(1, 7)]
+    assert state_a.version == state_b.version == 6
+    assert state_a.sync_payload(state_b.epoch, 4)[1] == state_b.sync_payload(state_a.epoch, 4)[1]
+
+
+def test_new_worker_versions_continue_from_the_broker(broker_path):
+    bridge_a, _, _ = make_worker(broker_path)
+    assert bridge_a.submit_config('b1', config(1)) == 1
+    assert bridge_a.submit_config('b1', config(2)) == 2
+
+    # A worker that joins later numbers changes like the others; deltas it
+    # never saw are below its floor, so it answers with a snapshot
+    bridge_b, state_b, out_b = make_worker(broker_path)
+    assert bridge_b.submit_config('b1', config(3)) == 3
+    wait_for(lambda: out_b)
+    assert out_b[0][2]['version'] == 3
+    event, _ = state_b.sync_payload(state_b.epoch, 1)
+    assert event != DELTA_EVENT
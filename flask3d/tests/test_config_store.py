@@ -0,0 +1,91 @@
+import json
+
+import config_store
+from config_store import ButtonConfigStore
+
+
+def make_store(tmp_path, **kwargs):
+    kwargs.setdefault('flush_interval', 60)
+    return ButtonConfigStore(str(tmp_path / 'button_config.json'), **kwargs)
+
+
+def config(x):
+    return {'position': {'x': x, 'y': 0, 'z': 0}, 'scale': 1}
+
+
+def test_replays_the_change_log_over_the_snapshot(tmp_path):
+    (tmp_path / 'button_config.json').write_text(json.dumps({'a': config(1), 'b': config(1)}))
+    (tmp_path / 'button_config.log').write_text(
+        json.dumps({'id': 'a', 'config': config(2)}) + '\n'
+        + json.dumps({'id': 'c', 'config': config(3)}) + '\n'
+        + json.dumps({'id': 'a', 'config': config(4)}) + '\n')
+
+    store = make_store(tmp_path, persist=False)
+    assert store.get_all() == {'a': config(4), 'b': config(1), 'c': config(3)}
+
+
+def test_skips_a_torn_final_line(tmp_path):
+    entry = json.dumps({'id': 'a', 'config': config(2)})
+    (tmp_path / 'button_config.log').write_text(entry + '\n' + entry[:10])
+
+    store = make_store(tmp_path, persist=False)
+    assert store.get_all() == {'a': config(2)}
+
+
+def test_flush_appends_latest_config_per_button(tmp_path):
+    store = make_store(tmp_path)
+    store.set('a', config(1))
+    store.set('a', config(2))
+    store.set('b', config(3))
+    store.flush()
+
+    lines = (tmp_path / 'button_config.log').read_text().splitlines()
+    assert [json.loads(line)['id'] for line in lines] == ['a', 'b']
+    assert not (tmp_path / 'button_config.json').exists()
+    assert make_store(tmp_path, persist=False).get_all() == {'a': config(2), 'b': config(3)}
+    store.close()
+
+
+def test_compacts_once_the_log_outgrows_the_threshold(tmp_path):
+    store = make_store(tmp_path, min_compact_entries=3)
+    store.set('a', config(1))
+    store.set('b', config(1))
+    store.flush()
+    assert (tmp_path / 'button_config.log').exists()
+
+    store.set('a', config(2))
+    store.flush()
+    assert not (tmp_path / 'button_config.log').exists()
+    assert not (tmp_path / 'button_config.json.tmp').exists()
+    assert json.loads((tmp_path / 'button_config.json').read_text()) == {'a': config(2), 'b': config(1)}
+    store.close()
+
+
+def test_close_compacts_everything_into_the_snapshot(tmp_path):
+    store = make_store(tmp_path)
+    store.set('a', config(1))
+    store.close()
+
+    assert not (tmp_path / 'button_config.log').exists()
+    assert json.loads((tmp_path / 'button_config.json').read_text()) == {'a': config(1)}
+
+
+def test_disk_writes_leave_the_hub_when_monkey_patched(tmp_path, monkeypatch):
+    offloaded = []
+
+    def execute(func, *args):
+        offloaded.append(func.__name__)
+        return func(*args)
+    monkeypatch.setattr(config_store.patcher, 'is_monkey_patched', lambda module: True)
+    monkeypatch.setattr(config_store.tpool, 'execute', execute)
+
+    store = make_store(tmp_path, min_compact_entries=1)
+    store.set('a', config(1))
+    store.flush()
+    assert offloaded == ['_append_lines', '_write_snapshot']
+
+    # After close (e.g. at exit) writes run inline
+    store.set('b', config(1))
+    store.close()
+    assert offloaded == ['_append_lines', '_write_snapshot']
+    assert json.loads((tmp_path / 'button_config.json').read_text()) == {'a': config(1), 'b': config(1)}
@@ -0,0 +1,117 @@
+import pytest
+
+from module_index import mask_strings, parse_imports, strip_comments, strongly_connected
+
+
+def test_strip_comments_keeps_strings_and_line_numbers():
+    source = ("const url = 'http://example.com'; // trailing\n"
+              "/* block\n   comment */ const s = \"/* not a comment */\";\n"
+              "const t = `// nor this`;\n")
+    stripped = strip_comments(source)
+    assert "'http://example.com'" in stripped
+    assert '"/* not a comment */"' in stripped
+    assert '`// nor this`' in stripped
+    assert 'trailing' not in stripped and 'block' not in stripped
+    assert stripped.count('\n') == source.count('\n')
+
+
+def test_strip_comments_handles_escaped_quotes():
+    stripped = strip_comments("const s = 'it\\'s // here'; // gone\n")
+    assert stripped == "const s = 'it\\'s // here'; \n"
+
+
+def test_mask_strings_keeps_offsets():
+    text = "import a from './a.js'; const s = \"x\\\"y\";"
+    masked = mask_strings(text)
+    assert len(masked) == len(text)
+    assert masked == "import a from 'xxxxxx'; const s = \"xxxx\";"
+
+
+def test_static_import_forms():
+    static, dynamic, unresolved = parse_imports(
+        "import './side-effect.js';\n"
+        "import def from './default.js';\n"
+        "import * as ns from \"./namespace.js\";\n"
+        "import def2, { a as b } from './mixed.js';\n"
+        "export { c } from './reexport.js';\n"
+        "export * from './star.js';\n"
+        "export * as all from './star-as.js';\n")
+    assert static == ['./side-effect.js', './default.js', './namespace.js', './mixed.js',
+                      './reexport.js', './star.js', './star-as.js']
+    assert dynamic == [] and unresolved == 0
+
+
+def test_multi_line_imports():
+    static, _, _ = parse_imports(
+        "import {\n"
+        "    first,\n"
+        "    second, // why\n"
+        "    third\n"
+        "} from './many.js';\n"
+        "export {\n  x\n}\n  from\n  './later.js';\n")
+    assert static == ['./many.js', './later.js']
+
+
+def test_dynamic_imports():
+    static, dynamic, unresolved = parse_imports(
+        "const a = await import('./lazy.js');\n"
+        "import ( \"./spaced.js\" ).then(start);\n"
+        "const b = import(`./template.js`);\n"
+        "const c = import(`./pages/${name}.js`);\n"
+        "const d = import(path);\n")
+    assert static == []
+    assert dynamic == ['./lazy.js', './spaced.js', './template.js']
+    assert unresolved == 2
+
+
+def test_imports_in_comments_and_strings_are_ignored():
+    static, dynamic, unresolved = parse_imports(
+        "// import './line-comment.js';\n"
+        "/* import x from './block.js';\n   import('./block-dynamic.js') */\n"
+        "const s = \"import y from './in-string.js'\";\n"
+        "const t = `export * from './in-template.js'; import('./in-template-dynamic.js')`;\n"
+        "import real from './real.js';\n")
+    assert static == ['./real.js']
+    assert dynamic == [] and unresolved == 0
+
+
+def test_duplicates_are_reported_once():
+    static, dynamic, _ = parse_imports(
+        "import a from './a.js';\nimport { b } from './a.js';\n"
+        "import('./lazy.js'); import('./lazy.js');\n")
+    assert static == ['./a.js']
+    assert dynamic == ['./lazy.js']
+
+
+def test_strongly_connected_orders_dependencies_first():
+    graph = {'main': {'a', 'b'}, 'a': {'util'}, 'b': {'util'}, 'util': set()}
+    components = strongly_connected(graph)
+    assert components[0] == ['util']
+    assert components[-1] == ['main']
+    assert sorted(map(tuple, components)) == [('a',), ('b',), ('main',), ('util',)]
+
+
+def test_strongly_connected_groups_cycles():
+    graph = {'main': {'a'}, 'a': {'b'}, 'b': {'a', 'util'}, 'util': {'util'}, 'lonely': set()}
+    components = strongly_connected(graph)
+    assert ['a', 'b'] in components
+    assert ['util'] in components
+    order = {member: i for i, component in enumerate(components) for member in component}
+    assert order['util'] < order['a'] < order['main']
+    assert sorted(member for component in components for member in component) == sorted(graph)
+
+
+def test_strongly_connected_includes_nodes_only_seen_as_dependencies():
+    assert strongly_connected({'main': {'missing'}}) == [['missing'], ['main']]
+
+
+@pytest.mark.parametrize('cycle', [False, True])
+def test_strongly_connected_handles_deep_chains(cycle):
+    depth = 5000
+    graph = {f'm{i}': {f'm{i + 1}'} for i in range(depth)}
+    graph[f'm{depth}'] = {'m0'} if cycle else set()
+    components = strongly_connected(graph)
+    if cycle:
+        assert len(components) == 1 and len(components[0]) == depth + 1
+    else:
+        assert components[0] == [f'm{depth}'] and components[-1] == ['m0']
@@ -0,0 +1,116 @@
+from scene_state import SceneState, diff_config, flatten_config, merge_deltas
+
+
+class FakeStore:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, button_id, default=None):
+        return self.data.get(button_id, default)
+
+    def get_all(self):
+        return dict(self.data)
+
+    def set(self, button_id, config):
+        self.data[button_id] = config
+
+
+def make_config(x, color=None):
+    config = {'id': 'b1', 'position': {'x': x, 'y': 0, 'z': 0}, 'scale': 1}
+    if color is not None:
+        config['color'] = color
+    return config
+
+
+def test_flatten_config():
+    assert flatten_config({'position': {'x': 1, 'y': 2}, 'scale': 1, 'meta': {}}) == {
+        'position.x': 1, 'position.y': 2, 'scale': 1, 'meta': {}
+    }
+
+
+def test_diff_config_ignores_id():
+    changed, removed = diff_config({}, make_config(1))
+    assert 'id' not in changed
+    assert changed == {'position.x': 1, 'position.y': 0, 'position.z': 0, 'scale': 1}
+    assert removed == []
+
+
+def test_diff_config_reports_changed_and_removed_leaves():
+    changed, removed = diff_config(make_config(1, color='red'), make_config(2))
+    assert changed == {'position.x': 2}
+    assert removed == ['color']
+
+
+def test_merge_deltas_keeps_latest_values():
+    older = {'version': 1, 'id': 'b1', 'set': {'position.x': 1, 'scale': 1}}
+    newer = {'version': 2, 'id': 'b1', 'set': {'position.x': 2}}
+    assert merge_deltas(older, newer) == {
+        'version': 2, 'id': 'b1', 'set': {'position.x': 2, 'scale': 1}
+    }
+
+
+def test_merge_deltas_unset_then_set():
+    older = {'version': 1, 'id': 'b1', 'set': {'color': 'red'}}
+    unset = {'version': 2, 'id': 'b1', 'set': {}, 'unset': ['color']}
+    merged = merge_deltas(older, unset)
+    assert merged['set'] == {}
+    assert merged['unset'] == ['color']
+
+    reset = {'version': 3, 'id': 'b1', 'set': {'color': 'blue'}}
+    merged = merge_deltas(merged, reset)
+    assert merged == {'version': 3, 'id': 'b1', 'set': {'color': 'blue'}}
+
+
+def test_apply_versions_and_skips_no_ops():
+    state = SceneState(FakeStore())
+    first = state.apply('b1', make_config(1))
+    assert first['version'] == 1
+    assert state.apply('b1', make_config(1)) is None
+    second = state.apply('b1', make_config(2))
+    assert second == {'version': 2, 'id': 'b1', 'set': {'position.x': 2}}
+    assert state.version == 2
+
+
+def test_deltas_since():
+    state = SceneState(FakeStore())
+    for x in range(1, 4):
+        state.apply('b1', make_config(x))
+    assert [d['version'] for d in state.deltas_since(1)] == [2, 3]
+    assert state.deltas_since(3) == []
+    assert state.deltas_since(4) is None
+
+
+def test_deltas_since_rejects_evicted_versions():
+    state = SceneState(FakeStore(), history=2)
+    for x in range(1, 5):
+        state.apply('b1', make_config(x))
+    assert state.deltas_since(1) is None
+    assert [d['version'] for d in state.deltas_since(2)] == [3, 4]
+
+
+def test_external_versions_that_jump_raise_the_floor():
+    state = SceneState(FakeStore())
+    for version in (101, 102, 103):
+        state.apply('b1', make_config(version), version=version)
+    assert state.deltas_since(50) is None
+    assert [d['version'] for d in state.deltas_since(100)] == [101, 102, 103]
+
+    # A sequence gap (a message this worker never saw) cannot be bridged
+    state.apply('b1', make_config(0), version=110)
+    assert state.deltas_since(103) is None
+    assert [d['version'] for d in state.deltas_since(109)] == [110]
+
+
+def test_sync_payload():
+    state = SceneState(FakeStore())
+    state.apply('b1', make_config(1))
+    state.apply('b1', make_config(2))
+
+    event, payload = state.sync_payload(state.epoch, 1)
+    assert event == 'scene_deltas'
+    assert payload['version'] == 2
+    assert [d['version'] for d in payload['deltas']] == [2]
+
+    event, payload = state.sync_payload('another-epoch', 1)
+    assert event == 'scene_snapshot'
+    assert payload['buttons'] == {'b1': make_config(2)}
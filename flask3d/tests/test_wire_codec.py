@@ -0,0 +1,85 @@
+import struct
+
+import pytest
+
+from scene_state import DELTA_EVENT
+from wire_codec import (FORMAT_VERSION, HEADER, ButtonIndex, decode_transforms,
+                        encode_transforms, fits_float32, make_binary_encoder, split_delta)
+
+
+def float32(value):
+    return struct.unpack('<f', struct.pack('<f', value))[0]
+
+
+def test_transforms_round_trip():
+    records = [
+        (0, {'position.x': 1.5, 'position.y': -2.25, 'rotation.z': 0.1}),
+        (7, {'scale': 2.0}),
+        (3, {}),
+    ]
+    version, decoded = decode_transforms(encode_transforms(records, version=42))
+    assert version == 42
+    assert [index for index, _ in decoded] == [0, 7, 3]
+    for (_, expected), (_, values) in zip(records, decoded):
+        assert values == {path: float32(value) for path, value in expected.items()}
+
+
+def test_decode_rejects_other_format_versions():
+    data = HEADER.pack(FORMAT_VERSION + 1, 0, 0, 0)
+    with pytest.raises(ValueError):
+        decode_transforms(data)
+
+
+def test_split_delta():
+    transforms, rest = split_delta({'set': {
+        'position.x': 1, 'scale': 2.0, 'color': 'red', 'rotation.y': True
+    }})
+    assert transforms == {'position.x': 1, 'scale': 2.0}
+    assert rest == {'color': 'red', 'rotation.y': True}
+
+
+@pytest.mark.parametrize('value', [1e40, -1e39, 10 ** 40, float('inf'), float('nan'), '1'])
+def test_values_float32_cannot_hold_stay_json(value):
+    assert not fits_float32(value)
+    transforms, rest = split_delta({'set': {'position.x': value, 'position.y': 1.0}})
+    assert transforms == {'position.y': 1.0}
+    assert list(rest) == ['position.x']
+
+
+def test_button_index_interns_once():
+    index = ButtonIndex()
+    assert index.intern('a') == (0, True)
+    assert index.intern('b') == (1, True)
+    assert index.intern('a') == (0, False)
+    assert index.table() == ['a', 'b']
+
+
+def test_binary_encoder_packs_transforms_and_announces_new_ids():
+    encode = make_binary_encoder(ButtonIndex())
+    updates = {
+        (DELTA_EVENT, 'b1'): {'version': 5, 'id': 'b1', 'set': {'position.x': 1.0, 'color': 'red'}},
+        ('button_state_changed', 'b1'): {'id': 'b1', 'state': 'click'},
+    }
+    frame = encode(1, updates)
+    assert frame['index'] == [[0, 'b1']]
+    assert frame['events']['button_state_changed'] == [{'id': 'b1', 'state': 'click'}]
+    # Non-transform fields stay JSON
+    assert frame['events'][DELTA_EVENT] == [{'version': 5, 'id': 'b1', 'set': {'color': 'red'}}]
+    assert decode_transforms(frame['transforms']) == (5, [(0, {'position.x': 1.0})])
+
+    # Known ids are only announced again in catch-up frames
+    update = {(DELTA_EVENT, 'b1'): {'version': 6, 'id': 'b1', 'set': {'position.x': 2.0}}}
+    frame = encode(2, update)
+    assert 'index' not in frame
+    assert DELTA_EVENT not in frame['events']
+    assert encode(3, update, catch_up=True)['index'] == [[0, 'b1']]
+
+
+def test_binary_encoder_keeps_unpackable_transforms_json():
+    button_index = ButtonIndex()
+    encode = make_binary_encoder(button_index)
+    frame = encode(1, {(DELTA_EVENT, 'b1'): {'version': 1, 'id': 'b1', 'set': {'position.x': 1e40}}})
+    assert 'transforms' not in frame and 'index' not in frame
+    assert frame['events'][DELTA_EVENT] == [{'version': 1, 'id': 'b1', 'set': {'position.x': 1e40}}]
+    # Nothing was interned for a button without packed records
+    assert button_index.table() == []
@@ -0,0 +1,165 @@
+import math
+import struct
+import threading
+
+from scene_state import DELTA_EVENT
+
+FORMAT_JSON = 'json'
+FORMAT_BINARY = 'binary'
+FORMAT_VERSION = 1
+
+# Transform leaf paths packed as float32, in bit order of the record mask.
+# 'scale' is the uniform (scalar) scale used by the default button config.
+TRANSFORM_PATHS = (
+    'position.x', 'position.y', 'position.z',
+    'rotation.x', 'rotation.y', 'rotation.z',
+    'scale.x', 'scale.y', 'scale.z',
+    'scale'
+)
+TRANSFORM_BITS = {path: bit for bit, path in enumerate(TRANSFORM_PATHS)}
+
+# Frame header: format version, reserved, record count, scene version
+HEADER = struct.Struct('<BBII')
+# Record header: interned button index, component mask
+RECORD = struct.Struct('<IH')
+FLOAT = struct.Struct('<f')
+
+
+class ButtonIndex:
+    """Append-only mapping of button ids to small integers for binary frames."""
+
+    def __init__(self):
+        self._ids = []
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def intern(self, button_id):
+        """Return the index for ``button_id`` and whether it was newly assigned."""
+        index = self._index.get(button_id)
+        if index is not None:
+            return index, False
+        with self._lock:
+            index = self._index.get(button_id)
+            if index is not None:
+                return index, False
+            index = len(self._ids)
+            self._ids.append(button_id)
+            self._index[button_id] = index
+            return index, True
+
+    def table(self):
+        """Return the full id table; position in the list is the index."""
+        return list(self._ids)
+
+
+def fits_float32(value):
+    """Return True if ``value`` is a finite number float32 can hold."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    try:
+        FLOAT.pack(value)
+    except (OverflowError, struct.error):
+        return False
+    return math.isfinite(value)
+
+
+def split_delta(delta):
+    """Split a scene delta into packable transform values and the JSON remainder."""
+    transforms = {}
+    rest = {}
+    for path, value in delta.get('set', {}).items():
+        if path in TRANSFORM_BITS and fits_float32(value):
+            transforms[path] = value
+        else:
+            rest[path] = value
+    return transforms, rest
+
+
+def pack_values(values):
+    """Pack ``{path: value}`` into ``(component mask, float32 bytes)``."""
+    mask = 0
+    floats = []
+    for bit, path in enumerate(TRANSFORM_PATHS):
+        if path in values:
+            mask |= 1 << bit
+            floats.append(values[path])
+    return mask, struct.pack(f'<{len(floats)}f', *floats)
+
+
+def _join_records(packed, version):
+    parts = [HEADER.pack(FORMAT_VERSION, 0, len(packed), version)]
+    for index, mask, data in packed:
+        parts.append(RECORD.pack(index, mask))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def encode_transforms(records, version=0):
+    """Pack ``[(index, {path: value})]`` into a binary transform frame."""
+    return _join_records([(index, *pack_values(values)) for index, values in records], version)
+
+
+def decode_transforms(data):
+    """Unpack a binary transform frame into ``(version, [(index, {path: value})])``."""
+    format_version, _, count, version = HEADER.unpack_from(data, 0)
+    if format_version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported wire format version: {format_version}")
+    offset = HEADER.size
+    records = []
+    for _ in range(count):
+        index, mask = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        values = {}
+        for bit, path in enumerate(TRANSFORM_PATHS):
+            if mask & (1 << bit):
+                values[path] = FLOAT.unpack_from(data, offset)[0]
+                offset += FLOAT.size
+        records.append((index, values))
+    return version, records
+
+
+def make_binary_encoder(button_index):
+    """Build a broadcast frame encoder that packs scene delta transforms.
+
+    Scene deltas lose their transform paths, which travel as a single
+    ``transforms`` binary attachment per frame; everything else stays JSON.
+    Ids interned while encoding are announced in ``index`` as ``[index, id]``
+    pairs. Catch-up frames (sent to clients that skipped earlier frames)
+    announce every id they use. Ids are only interned once every record of
+    the frame has been packed, so a failed frame never leaves an index that
+    no client was told about.
+    """
+    def encode(seq, updates, catch_up=False):
+        events = {}
+        records = []
+        version = 0
+        for (event, _), payload in updates.items():
+            if event != DELTA_EVENT:
+                events.setdefault(event, []).append(payload)
+                continue
+
+            version = max(version, payload['version'])
+            transforms, rest = split_delta(payload)
+            if transforms:
+                records.append((payload['id'], *pack_values(transforms)))
+            if rest or payload.get('unset') or not transforms:
+                delta = {'version': payload['version'], 'id': payload['id'], 'set': rest}
+                if payload.get('unset'):
+                    delta['unset'] = payload['unset']
+                events.setdefault(event, []).append(delta)
+
+        frame = {'seq': seq, 'events': events}
+        packed = []
+        announced = []
+        for button_id, mask, data in records:
+            index, new = button_index.intern(button_id)
+            if new or catch_up:
+                announced.append([index, button_id])
+            packed.append((index, mask, data))
+        if packed:
+            frame['transforms'] = _join_records(packed, version)
+        if announced:
+            frame['index'] = announced
+        return frame
+
+    return encode